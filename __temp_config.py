@@ -3,9 +3,77 @@ DB_PASSWORD = "REDIFINE IN __config.py"
 DB_HOST = "REDIFINE IN __config.py"
 DB_BASE_NAME = "REDIFINE IN __config.py"
 DB_NEED_ECHO = "REDIFINE IN __config.py"
+DB_POOL_SIZE = 5
+DB_MAX_OVERFLOW = 10
+# milliseconds to cancel statement after, None to wait forever
+DB_STATEMENT_TIMEOUT = 30000
 
 LOGGER_NAME = "REDIFINE IN __config.py"
 
+# seconds, statements running longer are written to slow query log
+SLOW_QUERY_THRESHOLD = 0.5
+# part of slow SELECT statements to log with EXPLAIN ANALYZE output
+SLOW_QUERY_EXPLAIN_RATE = 0.1
+# minimal amount of seconds between two explains
+SLOW_QUERY_EXPLAIN_INTERVAL = 60
+SLOW_QUERY_MAX_PER_SECOND = 5
+
+# amount of questions on hot page
+HOT_FEED_SIZE = 50
+# seconds between merges of new activity to hot ranking
+HOT_RANK_INTERVAL = 10
+
+# seconds between writes of buffered question views
+VIEW_COUNTER_INTERVAL = 5
+# seconds between loads of new question signatures to duplicates index
+DUPLICATE_INDEX_INTERVAL = 30
+
+# amount of answers loaded at once on question page
+ANSWERS_PAGE_SIZE = 20
+
+# amount of questions on one page of tag feed
+TAG_FEED_PAGE_SIZE = 30
+
+# push new answers and scores to open question pages, every open page
+# holds one request thread of threaded server
+BROADCAST_ENABLED = False
+# amount of live event streams in one worker, keep it below --threads
+BROADCAST_MAX_STREAMS = 4
+# amount of live events waiting for one client before it is disconnected
+BROADCAST_QUEUE_SIZE = 100
+# seconds to keep live events stream open, browser reconnects after it
+BROADCAST_STREAM_LIFETIME = 60
+# directory of unix sockets to share live events between local processes,
+# events are delivered inside one process when None
+BROADCAST_SOCKET_DIR = None
+
+# profile part of requests (0..1) or requests with secret header
+PROFILER_SAMPLE_RATE = 0.0
+PROFILER_HEADER = "X-Profile"
+PROFILER_SECRET = None
+PROFILER_DIR = "profiles"
+# bytes of profiles to keep for every endpoint
+PROFILER_MAX_BYTES = 50 * 1024 * 1024
+# amount of the newest profiles of every endpoint shown on admin page
+PROFILER_SUMMARY_FILES = 100
+
+# responses smaller than this amount of bytes are sent uncompressed
+COMPRESSION_MIN_SIZE = 500
+# gzip level 1..9 (brotli quality when brotli package is installed)
+COMPRESSION_LEVEL = 6
+
+RATE_LIMIT_ENABLED = True
+# sqlite file to share rate limits between local processes,
+# every process limits on its own when None
+RATE_LIMIT_STORAGE = None
+# endpoint to "<count>/<second|minute|hour|day>", overrides view limits
+RATE_LIMITS = {}
+
+# addresses allowed to read /metrics
+METRICS_ALLOWED_IPS = ["127.0.0.1", "::1"]
+
+ADMIN_USERNAMES = []
+
 SECRET_KEY = "REDIFINE IN __config.py"
 
 DEBUG = "REDIFINE IN __config.py"
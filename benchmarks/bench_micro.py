@@ -0,0 +1,269 @@
+"""Micro benchmarks of per request python work.
+
+    Run from repository root:
+
+        python -m benchmarks.bench_micro --save benchmarks/baseline.json
+        python -m benchmarks.bench_micro --compare benchmarks/baseline.json
+
+    Cases cover model hybrids and methods, table name generation, forms,
+    flask_new_classy proxy dispatch and template rendering at several data
+    sizes. Data is kept in in-memory sqlite and relationships are loaded
+    before measurement, so db time isn't counted. Forms are validated with
+    CSRF disabled. Comparison exits with status 1 when any case is slower
+    than baseline by more than --threshold.
+
+    benchmarks/baseline.json was measured with python 3.6.15, SQLAlchemy
+    1.0.9, Flask 0.10.1, Jinja2 2.8, WTForms 2.0.2 on one core of Intel Xeon
+    virtual machine and is valid on that machine only. Back to back runs
+    there differ by up to 15%, so default --threshold is 0.2, but the same
+    code measured 30-80% slower on template cases an hour later. So save
+    baseline of unchanged code right before measuring a change, on any
+    other machine always.
+
+"""
+
+import sys
+import argparse
+
+from flask import Flask, g, render_template
+
+from promua_test_app.extensions.flask_new_classy import FlaskView, before, \
+    after, route
+from promua_test_app.extensions.rate_limit import RateLimiter
+from promua_test_app.forms import RegistrationForm, LoginForm, QuestionForm, \
+    AnswerForm
+from db_engine.db_models import *
+
+from .common import measure, print_table, make_session, save_results, \
+    load_results, compare_results
+
+
+SIZES = (10, 100)
+
+
+class Case(object):
+
+    def __init__(self, name, function, context=None, prepare=None,
+                 session=None):
+        """Benchmark case.
+
+            :param name:
+                case name, key of baseline;
+            :param function:
+                measured function without arguments;
+            :param context:
+                flask request context pushed during measurement or None;
+            :param prepare:
+                function called once in pushed context or None;
+            :param session:
+                scoped db session of pushed context, it is removed by
+                application teardown as session of real request.
+
+        """
+
+        self.name = name
+        self.function = function
+        self.context = context
+        self.prepare = prepare
+        self.session = session
+
+    def run(self, number):
+        """Best time of one call in microseconds"""
+
+        if self.context is None:
+            return measure(self.function, number)
+
+        with self.context:
+            g.db_session = self.session
+            if self.prepare is not None:
+                self.prepare()
+            return measure(self.function, number)
+
+
+def model_cases():
+    cases = []
+    for size in SIZES:
+        # size answers, every one rated by size voters
+        session = make_session(questions=1, answers=size, ratings=size)
+        question = session.query(Question).first()
+        answer = question.answers[0]
+        voter = session.query(User).filter(User.username == "voter 0").one()
+        # load relationships before measurement
+        len(answer.ratings), len(voter.ratings)
+
+        cases += [
+            Case("answer_rating[{}]".format(size),
+                 lambda answer=answer: answer.rating),
+            Case("answers_count[{}]".format(size),
+                 lambda question=question: question.answers_count),
+            Case("voted_for[{}]".format(size),
+                 lambda voter=voter: voter.voted_for(-1)),
+        ]
+    return cases
+
+
+def tablename_cases():
+    # declared_attr of Base, not evaluated name of some class
+    tablename = next(vars(klass)["__tablename__"] for klass in Base.__mro__
+                     if "__tablename__" in vars(klass))
+    return [Case("tablename[{}]".format(model.__name__),
+                 lambda model=model: tablename.fget(model))
+            for model in (User, QuestionActivity, ArchivedAnswer)]
+
+
+def form_cases(app, session):
+    forms = [
+        ("registration", RegistrationForm,
+         {"username": "user", "password": "secret", "password_": "secret"}),
+        ("login", LoginForm, {"username": "user", "password": "secret"}),
+        ("question", QuestionForm,
+         {"title": "Title", "content": "Content", "tags": "python, flask"}),
+        ("answer", AnswerForm, {"content": "Content"}),
+    ]
+
+    cases = []
+    for name, form_class, data in forms:
+        cases += [
+            Case("form[{}]".format(name), form_class,
+                 app.test_request_context("/", method="POST", data=data),
+                 session=session),
+            Case("form_validate[{}]".format(name),
+                 lambda form_class=form_class: form_class().validate(),
+                 app.test_request_context("/", method="POST", data=data),
+                 session=session),
+        ]
+    return cases
+
+
+limiter = RateLimiter()
+
+
+class BenchView(FlaskView):
+
+    route_base = "/bench/"
+
+    @staticmethod
+    def load_item(id_):
+        g.item = id_
+
+    @staticmethod
+    def mark_response(response):
+        response.headers["X-Bench"] = "1"
+        return response
+
+    @route("/plain/<id_>")
+    def plain(self, id_):
+        return id_
+
+    @limiter.limit("1000000/second")
+    @after(mark_response)
+    @before(load_item)
+    @route("/hooked/<id_>")
+    def hooked(self, id_):
+        return g.item
+
+
+def dispatch_cases():
+    app = Flask(__name__)
+    BenchView.register(app)
+
+    cases = []
+    for name in ("plain", "hooked"):
+        proxy = app.view_functions["BenchView:{}".format(name)]
+        context = app.test_request_context("/bench/{}/1".format(name))
+        cases.append(Case("dispatch[{}]".format(name),
+                          lambda proxy=proxy, context=context:
+                          proxy(**context.request.view_args),
+                          context))
+    return cases
+
+
+def template_cases(app, anonymous):
+    cases = []
+    for size in SIZES:
+        session = make_session(questions=size, answers=1)
+        questions = session.query(Question).order_by(desc(Question.date)).all()
+
+        def prepare_index(questions=questions):
+            g.current_user = anonymous
+            g.questions = questions
+            # load lazy relationships before measurement
+            render_template("index.html")
+
+        cases.append(Case("render_index[{}]".format(size),
+                          lambda: render_template("index.html"),
+                          app.test_request_context("/"), prepare_index,
+                          session))
+
+        session = make_session(questions=1, answers=size, ratings=size)
+        question = session.query(Question).first()
+        voter = session.query(User).filter(User.username == "voter 0").one()
+
+        def prepare_question(question=question, voter=voter):
+            g.current_user = voter
+            g.question = question
+            g.archived = False
+            g.unique_viewers = 0
+            g.answers = question.answers
+            g.next_answers = None
+            g.answer_form = AnswerForm()
+            render_template("question.html")
+
+        cases.append(Case("render_question[{}]".format(size),
+                          lambda: render_template("question.html"),
+                          app.test_request_context(
+                              "/question/{}".format(question.id)),
+                          prepare_question, session))
+    return cases
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=200,
+                        help="calls in one measurement")
+    parser.add_argument("--only", default="",
+                        help="run cases which names start with this prefix")
+    parser.add_argument("--save", metavar="PATH",
+                        help="save results as baseline")
+    parser.add_argument("--compare", metavar="PATH",
+                        help="compare results with baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="slowdown to report as regression, 0.2 is 20%%")
+    options = parser.parse_args(args)
+
+    # application with real templates and url map
+    import main as application
+    from promua_test_app.views import login_manager
+    app = application.app
+    app.config["WTF_CSRF_ENABLED"] = False
+
+    cases = model_cases() + tablename_cases() + \
+        form_cases(app, make_session(questions=0)) + \
+        dispatch_cases() + \
+        template_cases(app, login_manager.anonymous_user())
+
+    results = {}
+    for case in cases:
+        if case.name.startswith(options.only):
+            results[case.name] = case.run(options.number)
+
+    if options.save:
+        save_results(options.save, results)
+
+    if options.compare:
+        rows, regressions = compare_results(load_results(options.compare),
+                                            results, options.threshold)
+        print_table(["case", "baseline, us", "current, us", "change", ""],
+                    rows)
+        if regressions:
+            print("\n{} regressions: {}".format(len(regressions),
+                                               ", ".join(regressions)))
+            sys.exit(1)
+    else:
+        print_table(["case", "time, us"],
+                    [[name, "{:.1f}".format(value)]
+                     for name, value in sorted(results.items())])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Per call cost of hot view queries: built on every call vs baked.
+
+    Run from repository root:
+
+        python -m benchmarks.bench_queries --number 2000
+
+    Queries run against in-memory sqlite, so time is mostly python work of
+    query construction, compilation and result loading.
+
+    Built and baked functions of every query do the same work, so only
+    baking differs. get_answers_page_after continues from the middle
+    answer with keyset filter.
+
+    Second table compares the replaced question page query, which loaded
+    question with all answers ordered by Answer.rating subquery, with
+    baked question lookup plus the first answers page.
+
+    Results with --number 500, Python 3.6.15, SQLAlchemy 1.0.9, one core
+    of Intel Xeon VM:
+
+        query                   built, us  baked, us  speedup
+        load_user               2800.7     345.1      8.1x
+        login                   759.4      159.6      4.8x
+        get_latest_questions    3255.7     284.2      11.5x
+        get_single_question     602.2      117.2      5.1x
+        get_answers_page        4083.4     838.0      4.9x
+        get_answers_page_after  3430.1     513.3      6.7x
+        get_answer              701.5      137.9      5.1x
+
+        path           replaced, us  current, us  speedup
+        question_page  2439.4        811.7        3.0x
+
+"""
+
+import argparse
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload, contains_eager, subqueryload
+
+from db_engine import queries
+from db_engine.db_models import *
+
+from .common import measure, print_table, make_session
+
+
+ANSWERS_PAGE_SIZE = 20
+
+
+def answers_page(session, question_id, after=None):
+    """get_answers_page query built on every call"""
+
+    query = session.query(Answer).\
+        options(joinedload(Answer.author).joinedload(User.stats)).\
+        filter(Answer.question_id == question_id)
+    if after is not None:
+        query = query.filter(tuple_(Answer.score, Answer.id) <
+                             tuple_(*after))
+    return query.\
+        order_by(desc(Answer.score), desc(Answer.id)).\
+        limit(ANSWERS_PAGE_SIZE + 1).all()
+
+
+def cases(session):
+    """(name, built, baked) functions doing the same work"""
+
+    user = session.query(User).first()
+    question = session.query(Question).first()
+    answer = session.query(Answer).first()
+    # cursor of the middle answer, second page gets half of answers
+    middle = session.query(Answer).\
+        order_by(desc(Answer.score), desc(Answer.id)).\
+        offset(ANSWERS_PAGE_SIZE // 2).first()
+    after = middle.score, middle.id
+
+    return [
+        ("load_user",
+         lambda: session.query(User).
+         outerjoin(User.ratings).
+         options(joinedload(User.ratings)).
+         filter(User.id == user.id).one(),
+         lambda: queries.user_by_id(session, user.id).one()),
+        ("login",
+         lambda: session.query(User).
+         filter(User.username == user.username).one(),
+         lambda: queries.user_by_username(session, user.username).one()),
+        ("get_latest_questions",
+         lambda: session.query(Question).
+         options(subqueryload(Question.tags)).
+         order_by(desc(Question.date)).all(),
+         lambda: queries.latest_questions(session).all()),
+        ("get_single_question",
+         lambda: session.query(Question).
+         filter(Question.id == question.id).one(),
+         lambda: queries.question_by_id(session, question.id).one()),
+        ("get_answers_page",
+         lambda: answers_page(session, question.id),
+         lambda: queries.answers_page(session, Answer, question.id,
+                                      ANSWERS_PAGE_SIZE + 1).all()),
+        ("get_answers_page_after",
+         lambda: answers_page(session, question.id, after),
+         lambda: queries.answers_page(session, Answer, question.id,
+                                      ANSWERS_PAGE_SIZE + 1, after).all()),
+        ("get_answer",
+         lambda: session.query(Answer).
+         filter(Answer.id == answer.id).one(),
+         lambda: queries.answer_by_id(session, answer.id).one()),
+    ]
+
+
+def question_page_cases(session):
+    """(name, replaced, current) functions of question page queries"""
+
+    question = session.query(Question).first()
+
+    return [
+        ("question_page",
+         lambda: session.query(Question).
+         outerjoin(Question.answers).
+         options(contains_eager(Question.answers)).
+         filter(Question.id == question.id).
+         order_by(desc(Answer.rating)).one(),
+         lambda: (queries.question_by_id(session, question.id).one(),
+                  queries.answers_page(session, Answer, question.id,
+                                       ANSWERS_PAGE_SIZE + 1).all())),
+    ]
+
+
+def compare(cases, number):
+    rows = []
+    for name, first, second in cases:
+        first_time = measure(first, number)
+        second_time = measure(second, number)
+        rows.append([name, "{:.1f}".format(first_time),
+                     "{:.1f}".format(second_time),
+                     "{:.1f}x".format(first_time / second_time)])
+    return rows
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=2000,
+                        help="calls in one measurement")
+    options = parser.parse_args(args)
+
+    session = make_session(answers=ANSWERS_PAGE_SIZE)
+
+    print_table(["query", "built, us", "baked, us", "speedup"],
+                compare(cases(session), options.number))
+    print()
+    print_table(["path", "replaced, us", "current, us", "speedup"],
+                compare(question_page_cases(session), options.number))
+
+
+if __name__ == "__main__":
+    main()
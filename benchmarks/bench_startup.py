@@ -0,0 +1,89 @@
+"""Cold start time of application up to the first served request.
+
+    Run from repository root:
+
+        python -m benchmarks.bench_startup --runs 10
+
+    Every run starts new interpreter, imports main and serves one static
+    file request with test client, as new process would do. With --preload
+    db engine is created before the request, as serve.py master does
+    before forking workers. No db connection is needed.
+
+    Medians of 15 runs, python 3.6.15, SQLAlchemy 1.0.9, Flask 0.10.1, one
+    core of Intel Xeon virtual machine:
+
+        phase           default, ms   --preload, ms
+        import main     471.8         485.8 (engine created in master)
+        first request   64.0          25.8
+
+    Import time is spent mostly in sqlalchemy.orm and flask, which every
+    worker needs anyway. First request without preload loads psycopg2
+    dialect when engine is created.
+
+"""
+
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+from .common import print_table
+
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+if {preload!r}:
+    import promua_test_app.views
+    promua_test_app.views.get_db_session()
+    imported = time.perf_counter()
+response = main.app.test_client().get({path!r})
+served = time.perf_counter()
+assert response.status_code == 200, response.status
+print(json.dumps({{"import": imported - start, "request": served - imported}}))
+"""
+
+
+def run_once(path, preload=False):
+    """Start process, return seconds of (import, first request, whole run)"""
+
+    start = time.perf_counter()
+    output = subprocess.check_output([sys.executable, "-c",
+                                      CHILD.format(path=path,
+                                                   preload=preload)])
+    total = time.perf_counter() - start
+
+    phases = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+    return phases["import"], phases["request"], total
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10,
+                        help="amount of started processes")
+    parser.add_argument("--path", default="/static/css/additional.css",
+                        help="path of the first request")
+    parser.add_argument("--preload", action="store_true",
+                        help="create db engine before the first request")
+    options = parser.parse_args(args)
+
+    results = [run_once(options.path, options.preload)
+               for _ in range(options.runs)]
+
+    rows = []
+    for name, values in zip(["import main", "first request", "process total"],
+                            zip(*results)):
+        rows.append([name,
+                     "{:.1f}".format(min(values) * 1e3),
+                     "{:.1f}".format(statistics.median(values) * 1e3),
+                     "{:.1f}".format(max(values) * 1e3)])
+
+    print_table(["phase", "min, ms", "median, ms", "max, ms"], rows)
+
+
+if __name__ == "__main__":
+    main()
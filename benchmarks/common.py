@@ -0,0 +1,98 @@
+import json
+import timeit
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, scoped_session
+
+from db_engine.db_models import *
+
+
+def measure(function, number=1000, repeat=5):
+    """Best time of one function call in microseconds"""
+
+    timer = timeit.Timer(function)
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def print_table(header, rows):
+    """Print rows of values as aligned text table"""
+
+    rows = [header] + [[str(value) for value in row] for row in rows]
+    widths = [max(len(row[ind]) for row in rows) for ind in range(len(header))]
+    for row in rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+def make_session(questions=1, answers=1, ratings=0):
+    """Session of in-memory sqlite db with user, questions and answers.
+
+        Every answer gets ratings from the given amount of other users.
+
+    """
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = scoped_session(sessionmaker(bind=engine))
+
+    user = User("benchmark", "1")
+    session.add(user)
+    voters = [User("voter {}".format(ind), "1") for ind in range(ratings)]
+    session.add_all(voters)
+    for question_ind in range(questions):
+        question = Question("Question {}".format(question_ind),
+                            "Content of question {}".format(question_ind))
+        question.author = user
+        for answer_ind in range(answers):
+            answer = Answer("Answer {}".format(answer_ind))
+            answer.author = user
+            for voter in voters:
+                rating = AnswerRating(1)
+                rating.user = voter
+                answer.ratings.append(rating)
+            answer.score = len(voters)
+            question.answers.append(answer)
+        session.add(question)
+    session.commit()
+
+    return session
+
+
+def save_results(path, results):
+    """Save {case name: microseconds} as baseline"""
+
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare_results(baseline, results, threshold):
+    """Compare results with baseline.
+
+        Return (rows of report table, names of regressed cases). Case is
+        regressed when it is slower than baseline by more than threshold,
+        0.1 is 10%.
+
+    """
+
+    rows = []
+    regressions = []
+    for name, current in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            rows.append([name, "-", "{:.1f}".format(current), "-", "new"])
+            continue
+        change = current / base - 1
+        status = ""
+        if change > threshold:
+            status = "REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            status = "faster"
+        rows.append([name, "{:.1f}".format(base), "{:.1f}".format(current),
+                     "{:+.1%}".format(change), status])
+
+    return rows, regressions
@@ -0,0 +1,189 @@
+"""Archive of inactive questions.
+
+    Questions without new answers and votes for a long time are moved with
+    their answers and votes to archived_question, archived_answer and
+    archived_answer_rating tables. Tags are dropped. Hot tables and their
+    indexes keep active content only, archived questions are served read
+    only. Run this module to archive questions:
+
+        python -m db_engine.archive --days 365
+
+"""
+
+import datetime
+
+from sqlalchemy import select, func, literal, exists, and_, or_
+
+from .db_models import Question, Answer, AnswerRating, QuestionActivity, \
+    QuestionRank, QuestionViewers, QuestionSignature, ArchivedQuestion, \
+    ArchivedAnswer, ArchivedAnswerRating, Tag, QuestionTag
+from .ranking import activity_score, QUESTION_WEIGHT, ANSWER_WEIGHT, \
+    VOTE_WEIGHT
+
+
+def _inactive(session, cutoff):
+    """Query of ids of questions without activity since cutoff"""
+
+    last_answers = select([
+        Answer.question_id.label("question_id"),
+        func.max(Answer.date).label("date"),
+    ]).group_by(Answer.question_id).alias("last_answers")
+
+    # questions with not merged activity are still active
+    pending = exists().\
+        where(QuestionActivity.question_id == Question.id)
+
+    # any activity after cutoff alone gives rank higher than this one,
+    # so merged votes are taken into account too
+    min_score = activity_score(
+        min(QUESTION_WEIGHT, ANSWER_WEIGHT, VOTE_WEIGHT), cutoff
+    )
+
+    return session.query(Question.id).\
+        outerjoin(last_answers, last_answers.c.question_id == Question.id).\
+        outerjoin(QuestionRank, QuestionRank.question_id == Question.id).\
+        filter(Question.date < cutoff).\
+        filter(or_(last_answers.c.date == None,
+                   last_answers.c.date < cutoff)).\
+        filter(or_(QuestionRank.score == None,
+                   QuestionRank.score < min_score)).\
+        filter(~pending)
+
+
+def _cutoff(inactive_days):
+    return datetime.datetime.now() - datetime.timedelta(days=inactive_days)
+
+
+def inactive_questions(session, inactive_days, limit):
+    """Get ids of questions without activity for inactive_days days"""
+
+    rows = _inactive(session, _cutoff(inactive_days)).\
+        order_by(Question.id).\
+        limit(limit)
+
+    return [row.id for row in rows]
+
+
+def archive_questions(session, ids, inactive_days):
+    """Move questions with answers and votes to archive tables in one
+    transaction.
+
+        Questions and their answers are locked first, so new answers and
+        votes wait for archiving and then fail, and questions which got
+        activity meanwhile are skipped.
+        Return amount of archived questions.
+
+        :param session:
+            db session;
+        :param ids:
+            ids of questions to archive;
+        :param inactive_days:
+            days without activity to archive question.
+
+    """
+
+    if not ids:
+        return 0
+
+    session.query(Question.id).\
+        filter(Question.id.in_(ids)).\
+        order_by(Question.id).\
+        with_for_update().all()
+    ids = [row.id for row in _inactive(session, _cutoff(inactive_days)).
+           filter(Question.id.in_(ids))]
+    if not ids:
+        session.commit()
+        return 0
+
+    answer_ids = [row.id for row in session.query(Answer.id).
+                  filter(Answer.question_id.in_(ids)).
+                  order_by(Answer.id).
+                  with_for_update()]
+
+    now = datetime.datetime.now()
+
+    session.execute(ArchivedQuestion.__table__.insert().from_select(
+        ["id", "title", "content", "date", "views", "archived", "user_id"],
+        select([Question.id, Question.title, Question.content, Question.date,
+                Question.views, literal(now), Question.user_id]).
+        where(Question.id.in_(ids))
+    ))
+    if answer_ids:
+        session.execute(ArchivedAnswer.__table__.insert().from_select(
+            ["id", "content", "date", "score", "user_id", "question_id"],
+            select([Answer.id, Answer.content, Answer.date, Answer.score,
+                    Answer.user_id, Answer.question_id]).
+            where(Answer.id.in_(answer_ids))
+        ))
+        session.execute(ArchivedAnswerRating.__table__.insert().from_select(
+            ["answer_id", "user_id", "rating"],
+            select([AnswerRating.answer_id, AnswerRating.user_id,
+                    AnswerRating.rating]).
+            where(AnswerRating.answer_id.in_(answer_ids))
+        ))
+
+    tagged = select([func.count(QuestionTag.question_id)]).\
+        where(and_(QuestionTag.tag_id == Tag.id,
+                   QuestionTag.question_id.in_(ids))).\
+        as_scalar()
+    tag_ids = select([QuestionTag.tag_id]).\
+        where(QuestionTag.question_id.in_(ids))
+    session.execute(Tag.__table__.update().
+                    where(Tag.id.in_(tag_ids)).
+                    values(questions_count=Tag.questions_count - tagged))
+
+    if answer_ids:
+        session.execute(AnswerRating.__table__.delete().
+                        where(AnswerRating.answer_id.in_(answer_ids)))
+        session.execute(Answer.__table__.delete().
+                        where(Answer.id.in_(answer_ids)))
+    for model in (QuestionActivity, QuestionRank, QuestionViewers,
+                  QuestionSignature, QuestionTag):
+        session.execute(model.__table__.delete().
+                        where(model.question_id.in_(ids)))
+    session.execute(Question.__table__.delete().
+                    where(Question.id.in_(ids)))
+
+    session.commit()
+
+    return len(ids)
+
+
+def archive_inactive(session, inactive_days, batch_size=100):
+    """Archive all inactive questions by batches.
+
+        Return amount of archived questions.
+
+    """
+
+    total = 0
+    while True:
+        ids = inactive_questions(session, inactive_days, batch_size)
+        total += archive_questions(session, ids, inactive_days)
+        if len(ids) < batch_size:
+            return total
+
+
+def archived_question(session, question_id):
+    """Get archived question or None"""
+
+    return session.query(ArchivedQuestion).get(question_id)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from db_engine.db_session import DBSession
+    from __config import *
+
+    parser = argparse.ArgumentParser(description="Archive inactive questions.")
+    parser.add_argument("--days", type=int, default=365,
+                        help="days without new answers to archive question")
+    parser.add_argument("--batch-size", type=int, default=100,
+                        help="questions archived in one transaction")
+    options = parser.parse_args()
+
+    session = DBSession(DB_USER_NAME, DB_PASSWORD, DB_HOST,
+                        DB_BASE_NAME, LOGGER_NAME)
+    print("Archived {} questions.".format(
+        archive_inactive(session, options.days, options.batch_size)))
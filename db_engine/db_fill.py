@@ -2,6 +2,8 @@ from random import choice
 
 from db_engine.db_models import *
 from db_engine.db_session import DBSession
+from db_engine.user_stats import rebuild_user_stats
+from db_engine.duplicates import MinHashIndex, backfill_signatures
 
 from faker import internet, lorem
 
@@ -10,6 +12,7 @@ from __config import *
 
 session = DBSession(DB_USER_NAME, DB_PASSWORD, DB_HOST,
                     DB_BASE_NAME, LOGGER_NAME)
+session.create_tables()
 
 
 def setup_db():
@@ -44,10 +47,14 @@ def setup_db():
             rating = AnswerRating(choice([1, -1]))
             rating.user = u
             a.ratings.append(rating)
+        a.score = sum(rating.rating for rating in a.ratings)
 
     session.add_all(answers)
     session.commit()
 
+    rebuild_user_stats(session)
+    backfill_signatures(session, MinHashIndex())
+
 
 setup_db()
 
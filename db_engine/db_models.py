@@ -4,9 +4,9 @@ from sqlalchemy.ext.declarative import declarative_base, declared_attr
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship, backref
 
-from sqlalchemy import UnicodeText, Integer, Text
+from sqlalchemy import UnicodeText, Integer, Text, Float, LargeBinary
 from sqlalchemy import DateTime, ForeignKey
-from sqlalchemy import Column
+from sqlalchemy import Column, Index
 from sqlalchemy import func, select, desc
 
 import bcrypt
@@ -81,16 +81,26 @@ class Question(Base):
     title = Column("title", UnicodeText, nullable=False)
     content = Column("content", UnicodeText, nullable=False)
     date = Column("date", DateTime, nullable=False)
+    # flushed periodically from in-process ViewCounter
+    views = Column("views", Integer, nullable=False, default=0)
     user_id = Column(Integer, ForeignKey("user.id"))
     answers = relationship(
         "Answer",
         backref=backref("question")
     )
+    # question_tag rows are written by db_engine.tags
+    tags = relationship(
+        "Tag",
+        secondary="question_tag",
+        order_by="Tag.name",
+        viewonly=True
+    )
 
     def __init__(self, title, content):
         self.title = title
         self.content = content
         self.date = datetime.datetime.now()
+        self.views = 0
 
     @hybrid_property
     def answers_count(self):
@@ -102,6 +112,9 @@ class Answer(Base):
     id = Column("id", Integer, primary_key=True)
     content = Column("content", UnicodeText, nullable=False)
     date = Column("date", DateTime, nullable=False)
+    # sum of ratings, kept in sync by rate_answer view, filled for existing
+    # answers by db_engine.upgrade
+    score = Column("score", Integer, nullable=False, default=0)
     user_id = Column(Integer, ForeignKey("user.id"))
     question_id = Column(Integer, ForeignKey("question.id"))
     ratings = relationship(
@@ -109,9 +122,14 @@ class Answer(Base):
         backref=backref("answer")
     )
 
+    __table_args__ = (
+        Index("ix_answer_question_score", "question_id", "score", "id"),
+    )
+
     def __init__(self, content):
         self.content = content
         self.date = datetime.datetime.now()
+        self.score = 0
 
     @hybrid_property
     def rating(self):
@@ -134,4 +152,142 @@ class AnswerRating(Base):
     )
 
     def __init__(self, rating):
-        self.rating = rating
\ No newline at end of file
+        self.rating = rating
+
+
+class QuestionActivity(Base):
+
+    id = Column("id", Integer, primary_key=True)
+    question_id = Column(Integer, ForeignKey("question.id"), nullable=False)
+    weight = Column("weight", Float, nullable=False)
+    date = Column("date", DateTime, nullable=False)
+
+    def __init__(self, question_id, weight):
+        self.question_id = question_id
+        self.weight = weight
+        self.date = datetime.datetime.now()
+
+
+class QuestionRank(Base):
+
+    question_id = Column(Integer, ForeignKey("question.id"), primary_key=True)
+    score = Column("score", Float, nullable=False, index=True)
+    question = relationship(
+        "Question",
+        backref=backref("rank", uselist=False)
+    )
+
+    def __init__(self, question_id, score):
+        self.question_id = question_id
+        self.score = score
+
+
+class QuestionViewers(Base):
+
+    question_id = Column(Integer, ForeignKey("question.id"), primary_key=True)
+    # HyperLogLog registers of unique viewers
+    sketch = Column("sketch", LargeBinary, nullable=False)
+
+    def __init__(self, question_id, sketch):
+        self.question_id = question_id
+        self.sketch = sketch
+
+
+class QuestionSignature(Base):
+
+    question_id = Column(Integer, ForeignKey("question.id"), primary_key=True)
+    # packed MinHash signature, see db_engine.duplicates
+    signature = Column("signature", LargeBinary, nullable=False)
+
+    def __init__(self, question_id, signature):
+        self.question_id = question_id
+        self.signature = signature
+
+
+class UserStats(Base):
+
+    user_id = Column(Integer, ForeignKey("user.id"), primary_key=True)
+    # sum of scores of user answers
+    reputation = Column("reputation", Integer, nullable=False, default=0)
+    answers_count = Column("answers_count", Integer, nullable=False, default=0)
+    questions_count = Column("questions_count", Integer, nullable=False,
+                             default=0)
+    votes_cast = Column("votes_cast", Integer, nullable=False, default=0)
+    user = relationship(
+        "User",
+        backref=backref("stats", uselist=False)
+    )
+
+    def __init__(self, reputation=0, answers_count=0, questions_count=0,
+                 votes_cast=0):
+        self.reputation = reputation
+        self.answers_count = answers_count
+        self.questions_count = questions_count
+        self.votes_cast = votes_cast
+
+
+class ArchivedQuestion(Base):
+
+    id = Column("id", Integer, primary_key=True)
+    title = Column("title", UnicodeText, nullable=False)
+    content = Column("content", UnicodeText, nullable=False)
+    date = Column("date", DateTime, nullable=False)
+    views = Column("views", Integer, nullable=False, default=0)
+    archived = Column("archived", DateTime, nullable=False)
+    user_id = Column(Integer, ForeignKey("user.id"))
+    author = relationship("User")
+
+
+class ArchivedAnswer(Base):
+
+    id = Column("id", Integer, primary_key=True)
+    content = Column("content", UnicodeText, nullable=False)
+    date = Column("date", DateTime, nullable=False)
+    # score of answer when it was archived
+    score = Column("score", Integer, nullable=False, default=0)
+    user_id = Column(Integer, ForeignKey("user.id"))
+    question_id = Column(Integer, ForeignKey("archived_question.id"))
+    author = relationship("User")
+
+    __table_args__ = (
+        Index("ix_archived_answer_question_score",
+              "question_id", "score", "id"),
+    )
+
+
+class ArchivedAnswerRating(Base):
+
+    answer_id = Column(Integer, ForeignKey("archived_answer.id"),
+                       primary_key=True)
+    user_id = Column(Integer, ForeignKey("user.id"), primary_key=True)
+    rating = Column("rating", Integer, nullable=False)
+
+
+class Tag(Base):
+
+    id = Column("id", Integer, primary_key=True)
+    name = Column("name", UnicodeText, nullable=False, unique=True)
+    # kept in sync by db_engine.tags and db_engine.archive
+    questions_count = Column("questions_count", Integer, nullable=False,
+                             default=0)
+
+    def __init__(self, name):
+        self.name = name
+        self.questions_count = 0
+
+
+class QuestionTag(Base):
+
+    question_id = Column(Integer, ForeignKey("question.id"), primary_key=True)
+    tag_id = Column(Integer, ForeignKey("tag.id"), primary_key=True)
+    # copy of question date to read tag feed from index only
+    date = Column("date", DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_question_tag_tag_date", "tag_id", "date", "question_id"),
+    )
+
+    def __init__(self, question_id, tag_id, date):
+        self.question_id = question_id
+        self.tag_id = tag_id
+        self.date = date
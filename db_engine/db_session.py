@@ -1,4 +1,4 @@
-from logging import Logger, INFO
+from logging import getLogger, INFO
 
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, scoped_session
@@ -10,9 +10,14 @@ from .db_models import *
 class DBSession(scoped_session):
 
     def __init__(self, user, password, db_host, db_name,
-                 logger_name, need_echo=False):
+                 logger_name, need_echo=False, slow_query_log=None,
+                 pool_metrics=None, pool_size=5, max_overflow=10,
+                 statement_timeout=None):
         """Create db session. Return engine and Base class.
 
+            Connection is opened on the first query, tables are created
+            by create_tables only.
+
             :param user:
                 db username;
             :param password:
@@ -22,23 +27,50 @@ class DBSession(scoped_session):
             :param db_name:
                 db name;
             :param need_echo:
-                flag: show or not sql statement.
+                flag: show or not sql statement;
+            :param slow_query_log:
+                SlowQueryLog object to listen engine statements or None;
+            :param pool_metrics:
+                PoolMetrics object to count pool events or None;
+            :param pool_size:
+                amount of connections kept in pool;
+            :param max_overflow:
+                amount of connections opened over pool size when it is busy;
+            :param statement_timeout:
+                milliseconds to cancel statement after or None.
 
         """
 
         self.base = Base
         engine = "postgresql+psycopg2://{user}:{password}@{db_host}/{db_name}"
         engine = engine.format(**vars())
+        options = {}
+        if pool_metrics is not None:
+            options["poolclass"] = pool_metrics.pool_class()
+        if statement_timeout:
+            options["connect_args"] = {
+                "options": "-c statement_timeout={}".format(statement_timeout)
+            }
         self.engine = create_engine(engine, convert_unicode=True,
-                                    echo=need_echo)
-        self.base.metadata.create_all(self.engine)
+                                    echo=need_echo, pool_size=pool_size,
+                                    max_overflow=max_overflow, **options)
+        if slow_query_log is not None:
+            slow_query_log.attach(self.engine)
+        if pool_metrics is not None:
+            pool_metrics.attach(self.engine)
         maker = sessionmaker(autocommit=False, autoflush=False,
                              bind=self.engine)
 
-        self.logger = Logger(logger_name, level=INFO)
+        self.logger = getLogger(logger_name)
+        self.logger.setLevel(INFO)
 
         super().__init__(maker)
 
+    def create_tables(self):
+        """Create missing tables of all models"""
+
+        self.base.metadata.create_all(self.engine)
+
     def __call__(self, **kw):
         """Redefine __call__ in sql alchemy to add get_one_or_log function."""
 
@@ -77,4 +109,12 @@ class DBSession(scoped_session):
                 msg = "Such {0} doesn't exist.".format(message)
                 self.logger.error(msg)
 
-        return result
\ No newline at end of file
+        return result
+
+
+if __name__ == "__main__":
+    from __config import *
+
+    session = DBSession(DB_USER_NAME, DB_PASSWORD, DB_HOST,
+                        DB_BASE_NAME, LOGGER_NAME)
+    session.create_tables()
@@ -0,0 +1,253 @@
+"""Near duplicate questions search.
+
+    Questions are indexed with MinHash signatures built by one permutation
+    hashing: every word shingle is hashed once and goes to one of the
+    signature bins, empty bins are filled from the next non empty one.
+    Signatures are split to bands for locality sensitive hashing, so query
+    looks up a few dict buckets instead of scanning questions.
+
+    Shingles are hashed with blake2b, so signatures are stable between
+    processes. They are stored in question_signature when question is
+    created and index is loaded from there, question texts are read only
+    by backfill of questions without signatures:
+
+        python -m db_engine.duplicates
+
+"""
+
+import re
+import struct
+import hashlib
+import threading
+
+from .db_models import Question, QuestionSignature
+
+
+class MinHashIndex(object):
+
+    _words = re.compile(r"\w+", re.UNICODE)
+
+    def __init__(self, bins=64, bands=16, shingle_size=3, threshold=0.5,
+                 refresh_margin=1000):
+        """Create empty index.
+
+            Pair of questions with similarity s becomes candidate with
+            probability 1 - (1 - s ** rows) ** bands, rows = bins / bands.
+
+            :param bins:
+                signature size;
+            :param bands:
+                amount of lsh bands, must divide bins;
+            :param shingle_size:
+                amount of words in shingle;
+            :param threshold:
+                minimal estimated jaccard similarity of duplicates;
+            :param refresh_margin:
+                amount of ids before the last indexed one which refresh
+                checks again, question ids are taken on flush and can be
+                committed in other order.
+
+        """
+
+        self.bins = bins
+        self.bands = bands
+        self.rows = bins // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.refresh_margin = refresh_margin
+
+        self.last_id = 0
+        self.loaded = False
+        self._bin = struct.Struct("<QB")
+        self._lock = threading.Lock()
+        self._signatures = {}
+        self._buckets = [{} for _ in range(bands)]
+
+    def shingles(self, text):
+        words = self._words.findall(text.lower())
+        size = min(self.shingle_size, len(words))
+        return {tuple(words[ind:ind + size])
+                for ind in range(len(words) - size + 1)}
+
+    @staticmethod
+    def _hash(shingle):
+        data = "\x1f".join(shingle).encode("utf-8")
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(),
+                              "little")
+
+    def signature(self, title, content):
+        """MinHash signature of question text.
+
+            Every bin is (value, shift), shift is 0 for own values and
+            distance to the bin value is borrowed from for empty ones.
+
+        """
+
+        bins = [None] * self.bins
+        for shingle in self.shingles(title) | self.shingles(content):
+            hashed = self._hash(shingle)
+            ind = hashed % self.bins
+            value = hashed // self.bins
+            if bins[ind] is None or value < bins[ind]:
+                bins[ind] = value
+
+        if all(value is None for value in bins):
+            return tuple(bins)
+
+        # densification: borrow own values of the next non empty bins
+        signature = []
+        for ind in range(self.bins):
+            shift = 0
+            while bins[(ind + shift) % self.bins] is None:
+                shift += 1
+            signature.append((bins[(ind + shift) % self.bins], shift))
+
+        return tuple(signature)
+
+    def pack(self, signature):
+        return b"".join(self._bin.pack(*item) for item in signature)
+
+    def unpack(self, data):
+        return tuple(self._bin.iter_unpack(data))
+
+    def _band_keys(self, signature):
+        return [signature[ind * self.rows:(ind + 1) * self.rows]
+                for ind in range(self.bands)]
+
+    def add(self, question_id, title, content):
+        self.add_signature(question_id, self.signature(title, content))
+
+    def add_signature(self, question_id, signature):
+        with self._lock:
+            self._signatures[question_id] = signature
+            for bucket, key in zip(self._buckets, self._band_keys(signature)):
+                bucket.setdefault(key, set()).add(question_id)
+            self.last_id = max(self.last_id, question_id)
+
+    def remove(self, question_id):
+        with self._lock:
+            signature = self._signatures.pop(question_id, None)
+            if signature is None:
+                return
+            for bucket, key in zip(self._buckets, self._band_keys(signature)):
+                ids = bucket.get(key)
+                if ids:
+                    ids.discard(question_id)
+                    if not ids:
+                        del bucket[key]
+
+    def query(self, title, content, limit=5):
+        """Find likely duplicates of question text.
+
+            Return list of (question id, estimated similarity) sorted by
+            similarity.
+
+        """
+
+        signature = self.signature(title, content)
+        if signature[0] is None:
+            return []
+
+        with self._lock:
+            candidates = set()
+            for bucket, key in zip(self._buckets, self._band_keys(signature)):
+                candidates.update(bucket.get(key, ()))
+
+            result = []
+            for question_id in candidates:
+                other = self._signatures[question_id]
+                similarity = sum(first == second for first, second
+                                 in zip(signature, other)) / self.bins
+                if similarity >= self.threshold:
+                    result.append((question_id, similarity))
+
+        result.sort(key=lambda item: item[1], reverse=True)
+        return result[:limit]
+
+    def store(self, session, question_id, title, content):
+        """Save signature of new question, committed together with session.
+
+            Index gets it with the next refresh.
+
+        """
+
+        signature = self.signature(title, content)
+        if signature[0] is not None:
+            session.add(QuestionSignature(question_id, self.pack(signature)))
+
+    def refresh(self, session, batch_size=1000):
+        """Add signatures of questions which aren't indexed yet.
+
+            Ids from refresh_margin ids before the last indexed one are
+            read again, so question committed after one with greater id
+            isn't skipped. Signatures are read only for new ids, so it is
+            cheap to call before every query. Called on empty index it
+            loads all stored signatures.
+
+        """
+
+        last_id = max(0, self.last_id - self.refresh_margin)
+        while True:
+            ids = [row.question_id for row in
+                   session.query(QuestionSignature.question_id).
+                   filter(QuestionSignature.question_id > last_id).
+                   order_by(QuestionSignature.question_id).
+                   limit(batch_size)]
+            new_ids = [question_id for question_id in ids
+                       if question_id not in self._signatures]
+            if new_ids:
+                rows = session.query(QuestionSignature).\
+                    filter(QuestionSignature.question_id.in_(new_ids))
+                for row in rows:
+                    self.add_signature(row.question_id,
+                                       self.unpack(row.signature))
+            if len(ids) < batch_size:
+                break
+            last_id = ids[-1]
+        self.loaded = True
+
+    def rebuild(self, session):
+        """Drop index and load it from all stored signatures"""
+
+        with self._lock:
+            self.last_id = 0
+            self.loaded = False
+            self._signatures = {}
+            self._buckets = [{} for _ in range(self.bands)]
+        self.refresh(session)
+
+
+def backfill_signatures(session, index, batch_size=1000):
+    """Store signatures of questions which don't have them.
+
+        Return amount of stored signatures.
+
+    """
+
+    total = 0
+    last_id = 0
+    while True:
+        rows = session.query(Question.id, Question.title, Question.content).\
+            outerjoin(QuestionSignature,
+                      QuestionSignature.question_id == Question.id).\
+            filter(QuestionSignature.question_id == None).\
+            filter(Question.id > last_id).\
+            order_by(Question.id).\
+            limit(batch_size).all()
+        for row in rows:
+            index.store(session, row.id, row.title, row.content)
+        session.commit()
+        total += len(rows)
+        if len(rows) < batch_size:
+            return total
+        last_id = rows[-1].id
+
+
+if __name__ == "__main__":
+    from db_engine.db_session import DBSession
+    from __config import *
+
+    session = DBSession(DB_USER_NAME, DB_PASSWORD, DB_HOST,
+                        DB_BASE_NAME, LOGGER_NAME)
+    print("Stored {} signatures.".format(
+        backfill_signatures(session, MinHashIndex())))
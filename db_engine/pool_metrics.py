@@ -0,0 +1,232 @@
+"""Connection pool metrics.
+
+    Pool events and checkout wait times are counted in process memory and
+    rendered in Prometheus text format. Every process has its own pool, so
+    its own metrics, which are labeled with process pid. Scrape hits one
+    worker of preforked server, sum series by pid to get server totals.
+
+"""
+
+import os
+import time
+import threading
+
+from sqlalchemy import event, exc, text
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.util import queue as sqla_queue
+
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for ind, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[ind] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self, name, description, labels=""):
+        lines = ["# HELP {} {}".format(name, description),
+                 "# TYPE {} histogram".format(name)]
+        prefix = labels + "," if labels else ""
+        with self._lock:
+            for bound, count in zip(self.buckets, self.counts):
+                lines.append('{}_bucket{{{}le="{}"}} {}'.format(
+                    name, prefix, bound, count))
+            lines.append('{}_bucket{{{}le="+Inf"}} {}'.format(
+                name, prefix, self.count))
+            lines.append("{}_sum{} {}".format(name, render_labels(labels),
+                                              self.sum))
+            lines.append("{}_count{} {}".format(name, render_labels(labels),
+                                                self.count))
+        return lines
+
+
+def render_labels(labels):
+    return "{{{}}}".format(labels) if labels else ""
+
+
+def render_counter(name, description, value, kind="counter", labels=""):
+    return ["# HELP {} {}".format(name, description),
+            "# TYPE {} {}".format(name, kind),
+            "{}{} {}".format(name, render_labels(labels), value)]
+
+
+class PoolMetrics(object):
+
+    wait_buckets = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self):
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.errors = 0
+        self.checkout_wait = Histogram(self.wait_buckets)
+        self.request_wait = Histogram(self.wait_buckets)
+        self._local = threading.local()
+
+    def pool_class(self):
+        """Queue pool class which reports checkout wait time and errors.
+
+            Metrics are kept on class, so pool recreated by engine.dispose()
+            reports to the same metrics.
+
+        """
+
+        return type("TimedQueuePool", (TimedQueuePool,), {"metrics": self})
+
+    def attach(self, engine):
+        """Listen pool events of engine"""
+
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "invalidate", self._on_invalidate)
+
+    def _on_connect(self, *args):
+        self.connects += 1
+
+    def _on_checkout(self, *args):
+        self.checkouts += 1
+
+    def _on_checkin(self, *args):
+        self.checkins += 1
+
+    def _on_invalidate(self, *args):
+        self.invalidations += 1
+
+    def observe_wait(self, seconds):
+        self.checkout_wait.observe(seconds)
+        self._local.wait = getattr(self._local, "wait", 0.0) + seconds
+
+    def start_request(self):
+        """Reset checkout wait of current thread request"""
+
+        self._local.wait = 0.0
+
+    def finish_request(self):
+        """Return checkout wait of current thread request in seconds"""
+
+        wait = getattr(self._local, "wait", 0.0)
+        self.request_wait.observe(wait)
+        self._local.wait = 0.0
+        return wait
+
+    def render(self, pool):
+        """Metrics and current pool state in Prometheus text format"""
+
+        labels = 'pid="{}"'.format(os.getpid())
+        lines = []
+        lines += render_counter("db_pool_connects_total",
+                                "New db connections.", self.connects,
+                                labels=labels)
+        lines += render_counter("db_pool_checkouts_total",
+                                "Connections taken from pool.", self.checkouts,
+                                labels=labels)
+        lines += render_counter("db_pool_checkins_total",
+                                "Connections returned to pool.", self.checkins,
+                                labels=labels)
+        lines += render_counter("db_pool_invalidations_total",
+                                "Connections invalidated after errors.",
+                                self.invalidations, labels=labels)
+        lines += render_counter("db_pool_errors_total",
+                                "Failed checkouts, connect errors and "
+                                "pool timeouts.", self.errors, labels=labels)
+        lines += self.checkout_wait.render(
+            "db_pool_checkout_wait_seconds", "Time to get connection from pool.",
+            labels
+        )
+        lines += self.request_wait.render(
+            "db_pool_request_wait_seconds", "Checkout wait of one request.",
+            labels
+        )
+        lines += render_counter("db_pool_size", "Pool size.",
+                                pool.size(), "gauge", labels)
+        lines += render_counter("db_pool_checked_out",
+                                "Connections in use.", pool.checkedout(),
+                                "gauge", labels)
+        lines += render_counter("db_pool_checked_in", "Idle connections.",
+                                pool.checkedin(), "gauge", labels)
+        # sqlalchemy overflow is negative while pool isn't filled
+        lines += render_counter("db_pool_overflow",
+                                "Connections over pool size.",
+                                max(0, pool.overflow()), "gauge", labels)
+        return lines
+
+
+class TimedQueuePool(QueuePool):
+
+    metrics = None
+    # idle connection wait of health check in current thread
+    _idle_only = threading.local()
+
+    def set_idle_only(self, timeout):
+        """Make checkouts of current thread wait idle pooled connection at
+        most timeout seconds instead of opening new one, None to reset.
+
+            Connection is opened anyway when pool has no connections yet.
+
+        """
+
+        self._idle_only.timeout = timeout
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            timeout = getattr(self._idle_only, "timeout", None)
+            if timeout is not None and (self.checkedin() or
+                                        self.checkedout()):
+                return self._get_idle(timeout)
+            return super()._do_get()
+        except Exception:
+            self.metrics.errors += 1
+            raise
+        finally:
+            self.metrics.observe_wait(time.perf_counter() - start)
+
+    def _get_idle(self, timeout):
+        try:
+            return self._pool.get(True, timeout)
+        except sqla_queue.Empty:
+            raise exc.TimeoutError("No idle connection in {} seconds."
+                                   .format(timeout))
+
+
+def check_health(engine, timeout=1.0):
+    """Check db with pooled connection.
+
+        Connection is validated with SELECT 1. Check waits idle pooled
+        connection at most timeout seconds and never opens overflow one,
+        so pool of connections hung on dead db is reported unhealthy and
+        busy pool doesn't grow. Only the very first check of process, when
+        pool is empty, opens connection, it stays in pool then.
+        Return (flag, message).
+
+    """
+
+    pool = engine.pool
+    timed = isinstance(pool, TimedQueuePool)
+    if timed:
+        pool.set_idle_only(timeout)
+    try:
+        connection = engine.connect()
+        try:
+            connection.execute(text("SELECT 1")).scalar()
+        finally:
+            connection.close()
+    except Exception as error:
+        return False, str(error)
+    finally:
+        if timed:
+            pool.set_idle_only(None)
+
+    return True, "ok"
@@ -0,0 +1,122 @@
+"""Baked queries of hot view paths.
+
+    Query construction and sql compilation are done on the first call only,
+    next calls take compiled statement from bakery cache and bind
+    parameters. Calls return baked result which supports all(), one() and
+    first() like usual query, so it can be passed to get_one_or_log.
+    Baked queries need plain session, scoped session is resolved to the
+    session of current thread.
+
+"""
+
+from sqlalchemy import bindparam, desc, tuple_
+from sqlalchemy.ext import baked
+from sqlalchemy.orm import joinedload, subqueryload, scoped_session
+
+from .db_models import User, Question, Answer, ArchivedAnswer
+
+
+bakery = baked.bakery()
+
+
+_user_by_id = bakery(
+    lambda session: session.query(User).
+    outerjoin(User.ratings).
+    options(joinedload(User.ratings)).
+    filter(User.id == bindparam("user_id"))
+)
+
+_user_by_username = bakery(
+    lambda session: session.query(User).
+    filter(User.username == bindparam("username"))
+)
+
+_latest_questions = bakery(
+    lambda session: session.query(Question).
+    options(subqueryload(Question.tags)).
+    order_by(desc(Question.date))
+)
+
+_question_by_id = bakery(
+    lambda session: session.query(Question).
+    filter(Question.id == bindparam("question_id"))
+)
+
+_answer_by_id = bakery(
+    lambda session: session.query(Answer).
+    filter(Answer.id == bindparam("answer_id"))
+)
+
+
+def _answers_page(model, keyset):
+    # model is a part of cache key, lambdas of both models share code
+    query = bakery(
+        lambda session: session.query(model).
+        options(joinedload(model.author).joinedload(User.stats)).
+        filter(model.question_id == bindparam("question_id")),
+        model
+    )
+    if keyset:
+        query += lambda query: query.filter(
+            tuple_(model.score, model.id) <
+            tuple_(bindparam("score"), bindparam("answer_id"))
+        )
+    query += lambda query: query.\
+        order_by(desc(model.score), desc(model.id)).\
+        limit(bindparam("limit"))
+    return query
+
+
+_answers_pages = {(model, keyset): _answers_page(model, keyset)
+                  for model in (Answer, ArchivedAnswer)
+                  for keyset in (False, True)}
+
+
+def _current(session):
+    if isinstance(session, scoped_session):
+        return session()
+    return session
+
+
+def user_by_id(session, user_id):
+    """User with loaded ratings"""
+
+    return _user_by_id(_current(session)).params(user_id=user_id)
+
+
+def user_by_username(session, username):
+    return _user_by_username(_current(session)).params(username=username)
+
+
+def latest_questions(session):
+    """All questions, the newest first"""
+
+    return _latest_questions(_current(session))
+
+
+def question_by_id(session, question_id):
+    return _question_by_id(_current(session)).params(question_id=question_id)
+
+
+def answer_by_id(session, answer_id):
+    return _answer_by_id(_current(session)).params(answer_id=answer_id)
+
+
+def answers_page(session, model, question_id, limit, after=None):
+    """Answers of question ordered by score, the highest first.
+
+        :param model:
+            Answer or ArchivedAnswer;
+        :param limit:
+            amount of answers;
+        :param after:
+            (score, id) of the last answer of previous page or None for
+            the first page.
+
+    """
+
+    query = _answers_pages[model, after is not None](_current(session))
+    params = {"question_id": question_id, "limit": limit}
+    if after is not None:
+        params["score"], params["answer_id"] = after
+    return query.params(**params)
@@ -0,0 +1,137 @@
+"""Hot questions ranking.
+
+    Question score is a logarithm of time decayed activity:
+
+        score = log(sum(weight * exp((date - EPOCH) / DECAY)))
+
+    Newer activity has exponentially bigger weight, so ordering by score is
+    the same as ordering by activity decayed to any current moment and scores
+    never have to be recomputed as time goes. New activity is written to the
+    question_activity change log in the same transaction as the answer or
+    vote, and apply_activity merges it to question_rank in background.
+
+"""
+
+import math
+import datetime
+
+from sqlalchemy import desc, func
+from sqlalchemy.orm import subqueryload
+
+from .db_models import Question, QuestionActivity, QuestionRank
+
+
+EPOCH = datetime.datetime(2015, 1, 1)
+# seconds for activity weight to decrease in e times
+DECAY = 12 * 60 * 60
+
+QUESTION_WEIGHT = 1.0
+ANSWER_WEIGHT = 2.0
+VOTE_WEIGHT = 1.0
+
+# any constant key shared by all processes applying activity
+ADVISORY_LOCK_KEY = 2029
+
+
+def activity_score(weight, date):
+    """Score of single activity"""
+
+    return math.log(weight) + (date - EPOCH).total_seconds() / DECAY
+
+
+def add_scores(first, second):
+    """Score of two merged activities, log(exp(first) + exp(second))"""
+
+    if first is None:
+        return second
+    high, low = max(first, second), min(first, second)
+    return high + math.log1p(math.exp(low - high))
+
+
+def log_activity(session, question_id, weight):
+    """Add activity to change log, it is committed together with session
+
+        :param session:
+            db session;
+        :param question_id:
+            id of question with new activity;
+        :param weight:
+            one of QUESTION_WEIGHT, ANSWER_WEIGHT, VOTE_WEIGHT.
+
+    """
+
+    session.add(QuestionActivity(question_id, weight))
+
+
+def apply_activity(session, batch_size=1000):
+    """Merge batch of change log to question ranks and remove it from log.
+
+        Only one process applies activity at a time, others skip the call.
+        Return amount of applied activities.
+
+        :param session:
+            db session;
+        :param batch_size:
+            maximum amount of activities to apply.
+
+    """
+
+    try:
+        locked = session.query(
+            func.pg_try_advisory_xact_lock(ADVISORY_LOCK_KEY)
+        ).scalar()
+        if not locked:
+            return 0
+
+        activities = session.query(QuestionActivity).\
+            order_by(QuestionActivity.id).\
+            limit(batch_size).all()
+        if not activities:
+            return 0
+
+        scores = {}
+        for activity in activities:
+            score = activity_score(activity.weight, activity.date)
+            scores[activity.question_id] = add_scores(
+                scores.get(activity.question_id), score
+            )
+
+        ranks = session.query(QuestionRank).\
+            filter(QuestionRank.question_id.in_(scores))
+        ranks = {rank.question_id: rank for rank in ranks}
+
+        for question_id, score in scores.items():
+            if question_id in ranks:
+                rank = ranks[question_id]
+                rank.score = add_scores(rank.score, score)
+            else:
+                session.add(QuestionRank(question_id, score))
+
+        # rows with lower id can be committed after select, keep them
+        session.query(QuestionActivity).\
+            filter(QuestionActivity.id.in_([activity.id
+                                            for activity in activities])).\
+            delete(synchronize_session=False)
+        session.commit()
+
+        return len(activities)
+
+    finally:
+        session.rollback()
+
+
+def get_hot_questions(session, limit):
+    """Get hot questions, read only question_rank score index
+
+        :param session:
+            db session;
+        :param limit:
+            amount of questions.
+
+    """
+
+    return session.query(Question).\
+        join(QuestionRank, QuestionRank.question_id == Question.id).\
+        options(subqueryload(Question.tags)).\
+        order_by(desc(QuestionRank.score)).\
+        limit(limit).all()
@@ -0,0 +1,201 @@
+import re
+import time
+import random
+import hashlib
+import threading
+from logging import getLogger, INFO
+
+from sqlalchemy import event
+
+
+class SlowQueryLog(object):
+    """Log statements which run longer than threshold.
+
+        Every slow statement is written with normalized sql, parameters
+        fingerprint, duration and endpoint which executed it. Part of slow
+        SELECT statements is explained and query plan is added to the record.
+        Both records and explains are rate limited, so slow query log can't
+        become a hotspot itself.
+
+    """
+
+    _bind_params = re.compile(r"%\(\w+\)s|%s|\?|(?<!:):\w+")
+    _literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+    _lists = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+    _spaces = re.compile(r"\s+")
+
+    def __init__(self, logger_name, threshold=0.5, explain_rate=0.0,
+                 explain_interval=60.0, explain_analyze=True,
+                 max_per_second=5.0, endpoint_getter=None):
+        """Create slow query log.
+
+            :param logger_name:
+                name of logger to write records to;
+            :param threshold:
+                statement duration in seconds to treat it as slow;
+            :param explain_rate:
+                part of slow SELECT statements which must be explained (0..1);
+            :param explain_interval:
+                minimal amount of seconds between two explains;
+            :param explain_analyze:
+                flag: use EXPLAIN ANALYZE or plain EXPLAIN;
+            :param max_per_second:
+                amount of records can be written per second, other records
+                are counted and reported with the next written one;
+            :param endpoint_getter:
+                function without arguments which returns name of current
+                endpoint or None.
+
+        """
+
+        self.logger = getLogger(logger_name + ".slow_query")
+        self.logger.setLevel(INFO)
+
+        self.threshold = threshold
+        self.explain_rate = explain_rate
+        self.explain_interval = explain_interval
+        self.explain_analyze = explain_analyze
+        self.max_per_second = max_per_second
+        self.endpoint_getter = endpoint_getter
+
+        self._lock = threading.Lock()
+        self._tokens = max_per_second
+        self._last_refill = time.monotonic()
+        self._suppressed = 0
+        self._last_explain = 0.0
+
+    def attach(self, engine):
+        """Listen statements executed by engine"""
+
+        event.listen(engine, "before_cursor_execute", self.before_execute)
+        event.listen(engine, "after_cursor_execute", self.after_execute)
+
+    def before_execute(self, conn, cursor, statement, parameters,
+                       context, executemany):
+        # start time lives with execution context, so failed statements
+        # don't leave it on connection
+        if context is not None:
+            context._slow_query_start = time.perf_counter()
+
+    def after_execute(self, conn, cursor, statement, parameters,
+                      context, executemany):
+        start = getattr(context, "_slow_query_start", None)
+        if start is None:
+            return
+        duration = time.perf_counter() - start
+        if duration < self.threshold:
+            return
+
+        suppressed = self._acquire()
+        if suppressed is None:
+            return
+
+        plan = None
+        if not executemany and self._need_explain(statement):
+            plan = self.explain(cursor, statement, parameters)
+
+        msg = "slow query {duration:.3f}s endpoint={endpoint} " \
+              "params={fingerprint} sql={sql}"
+        msg = msg.format(duration=duration,
+                         endpoint=self._endpoint(),
+                         fingerprint=self.fingerprint(parameters),
+                         sql=self.normalize(statement))
+        if suppressed:
+            msg += " ({} slow queries suppressed)".format(suppressed)
+        if plan:
+            msg += "\n" + plan
+
+        self.logger.warning(msg)
+
+    def normalize(self, statement):
+        """Replace bind parameters and literals with "?" and collapse spaces
+
+            :param statement:
+                sql statement.
+
+        """
+
+        statement = self._bind_params.sub("?", statement)
+        statement = self._literals.sub("?", statement)
+        statement = self._lists.sub("(...)", statement)
+        return self._spaces.sub(" ", statement).strip()
+
+    @staticmethod
+    def fingerprint(parameters):
+        """Short hash of parameters values, identical calls get same one"""
+
+        return hashlib.sha1(repr(parameters).encode("utf-8")).hexdigest()[:12]
+
+    def explain(self, cursor, statement, parameters):
+        """Get query plan of statement on the same connection.
+
+            Explain runs inside savepoint, so failed explain doesn't break
+            current transaction.
+
+        """
+
+        explain = "EXPLAIN ANALYZE " if self.explain_analyze else "EXPLAIN "
+        explain_cursor = cursor.connection.cursor()
+        try:
+            explain_cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                explain_cursor.execute(explain + statement, parameters)
+                plan = "\n".join(row[0] for row in explain_cursor.fetchall())
+            except Exception as error:
+                explain_cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                plan = "explain failed: {}".format(error)
+            explain_cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        except Exception as error:
+            plan = "explain failed: {}".format(error)
+        finally:
+            explain_cursor.close()
+
+        return plan
+
+    def _endpoint(self):
+        if self.endpoint_getter is None:
+            return None
+        try:
+            return self.endpoint_getter()
+        except Exception:
+            return None
+
+    def _acquire(self):
+        """Take token to write record.
+
+            Return amount of suppressed records since the last written one or
+            None if record must be suppressed.
+
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.max_per_second,
+                               self._tokens +
+                               (now - self._last_refill) * self.max_per_second)
+            self._last_refill = now
+
+            if self._tokens < 1:
+                self._suppressed += 1
+                return None
+
+            self._tokens -= 1
+            suppressed, self._suppressed = self._suppressed, 0
+
+            return suppressed
+
+    def _need_explain(self, statement):
+        if not self.explain_rate:
+            return False
+        if not statement.lstrip()[:6].upper() == "SELECT":
+            return False
+        if random.random() >= self.explain_rate:
+            return False
+
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_explain < self.explain_interval:
+                return False
+            self._last_explain = now
+
+        return True
@@ -0,0 +1,138 @@
+"""Question tags.
+
+    Tag feed is read from question_tag (tag_id, date, question_id) index
+    page by page with keyset cursor, questions are joined by primary key.
+    Amount of questions of every tag is kept in tag.questions_count.
+
+"""
+
+import re
+import datetime
+
+from sqlalchemy import desc, tuple_
+from sqlalchemy.orm import subqueryload
+from sqlalchemy.exc import IntegrityError
+
+from .db_models import Question, Tag, QuestionTag
+
+
+_tag = re.compile(r"[\w+#.-]+", re.UNICODE)
+
+CURSOR_DATE_FORMAT = "%Y%m%d%H%M%S%f"
+
+
+def parse_tags(line, limit=5, max_length=32):
+    """Get list of unique normalized tag names from user input"""
+
+    names = []
+    for name in _tag.findall(line.lower()):
+        name = name.strip(".-")[:max_length]
+        if name and name not in names:
+            names.append(name)
+    return names[:limit]
+
+
+def get_or_create_tags(session, names):
+    """Get tags by names, create missing ones"""
+
+    tags = session.query(Tag).filter(Tag.name.in_(names)).all()
+    existing = {tag.name for tag in tags}
+
+    for name in names:
+        if name in existing:
+            continue
+        # tag can be created by concurrent request
+        savepoint = session.begin_nested()
+        try:
+            tag = Tag(name)
+            session.add(tag)
+            savepoint.commit()
+        except IntegrityError:
+            savepoint.rollback()
+            tag = session.query(Tag).filter(Tag.name == name).one()
+        tags.append(tag)
+
+    return tags
+
+
+def add_tags(session, question, names):
+    """Tag flushed question, committed together with session
+
+        :param session:
+            db session;
+        :param question:
+            question with id;
+        :param names:
+            normalized tag names, see parse_tags.
+
+    """
+
+    if not names:
+        return
+
+    tags = get_or_create_tags(session, names)
+    for tag in tags:
+        session.add(QuestionTag(question.id, tag.id, question.date))
+
+    table = Tag.__table__
+    session.execute(table.update().
+                    where(table.c.id.in_([tag.id for tag in tags])).
+                    values(questions_count=table.c.questions_count + 1))
+
+
+def get_tag(session, name):
+    return session.query(Tag).filter(Tag.name == name).first()
+
+
+def tagged_questions(session, tag, cursor, limit):
+    """Get page of tag questions, the newest first.
+
+        Return (questions, cursor of the next page or None).
+
+        :param session:
+            db session;
+        :param tag:
+            Tag object;
+        :param cursor:
+            cursor of page or None for the first page;
+        :param limit:
+            amount of questions on page.
+
+    """
+
+    query = session.query(Question).\
+        join(QuestionTag, QuestionTag.question_id == Question.id).\
+        options(subqueryload(Question.tags)).\
+        filter(QuestionTag.tag_id == tag.id)
+
+    after = parse_cursor(cursor)
+    if after:
+        query = query.filter(
+            tuple_(QuestionTag.date, QuestionTag.question_id) < tuple_(*after)
+        )
+
+    questions = query.\
+        order_by(desc(QuestionTag.date), desc(QuestionTag.question_id)).\
+        limit(limit + 1).all()
+
+    next_cursor = None
+    if len(questions) > limit:
+        questions = questions[:limit]
+        last = questions[-1]
+        next_cursor = "{}-{}".format(last.date.strftime(CURSOR_DATE_FORMAT),
+                                     last.id)
+
+    return questions, next_cursor
+
+
+def parse_cursor(cursor):
+    """Get (date, question id) from cursor or None if it is invalid"""
+
+    if not cursor:
+        return None
+    try:
+        date, question_id = cursor.split("-")
+        return (datetime.datetime.strptime(date, CURSOR_DATE_FORMAT),
+                int(question_id))
+    except ValueError:
+        return None
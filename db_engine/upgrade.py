@@ -0,0 +1,66 @@
+"""Upgrade of database created before answer scores and read models.
+
+    create_tables creates only missing tables, so columns and index added
+    to existing question and answer tables, and data of new tables, need
+    this command. Run it from repository root once after deploy, before
+    workers are started; every step can be repeated:
+
+        python -m db_engine.upgrade
+
+    Steps:
+        - add question.views, answer.score and ix_answer_question_score,
+          which need PostgreSQL 9.6 for IF NOT EXISTS;
+        - create new tables;
+        - fill answer.score with sum of answer ratings;
+        - rebuild user_stats, reputation is sum of answer scores;
+        - store duplicate signatures of existing questions.
+
+"""
+
+from sqlalchemy import select, func, text
+
+from .db_models import Answer, AnswerRating
+
+
+_schema = (
+    "ALTER TABLE question "
+    "ADD COLUMN IF NOT EXISTS views INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE answer "
+    "ADD COLUMN IF NOT EXISTS score INTEGER NOT NULL DEFAULT 0",
+    "CREATE INDEX IF NOT EXISTS ix_answer_question_score "
+    "ON answer (question_id, score, id)",
+)
+
+
+def add_columns(session):
+    """Add columns and index of existing tables if they are missing"""
+
+    for statement in _schema:
+        session.execute(text(statement))
+    session.commit()
+
+
+def rebuild_answer_scores(session):
+    """Set score of every answer to sum of its ratings"""
+
+    ratings = select([func.sum(AnswerRating.rating)]).\
+        where(AnswerRating.answer_id == Answer.id).as_scalar()
+    session.execute(Answer.__table__.update().
+                    values(score=func.coalesce(ratings, 0)))
+    session.commit()
+
+
+if __name__ == "__main__":
+    from db_engine.db_session import DBSession
+    from db_engine.user_stats import rebuild_user_stats
+    from db_engine.duplicates import MinHashIndex, backfill_signatures
+    from __config import *
+
+    session = DBSession(DB_USER_NAME, DB_PASSWORD, DB_HOST,
+                        DB_BASE_NAME, LOGGER_NAME)
+    add_columns(session)
+    session.create_tables()
+    rebuild_answer_scores(session)
+    rebuild_user_stats(session)
+    print("Stored {} signatures.".format(
+        backfill_signatures(session, MinHashIndex())))
@@ -0,0 +1,149 @@
+"""User stats read model.
+
+    user_stats rows are updated incrementally in the same transaction as
+    new question, answer or vote. Run this module to rebuild all rows from
+    question, answer and answer_rating tables:
+
+        python -m db_engine.user_stats
+
+    Reputation is summed from answer.score, on database created before
+    scores run python -m db_engine.upgrade instead.
+
+"""
+
+from sqlalchemy import select, func, literal_column, text, union_all
+
+from .db_models import User, Question, Answer, AnswerRating, UserStats, \
+    ArchivedQuestion, ArchivedAnswer, ArchivedAnswerRating
+
+
+_STATS_COLUMNS = ("reputation", "answers_count", "questions_count",
+                  "votes_cast")
+
+_upsert = text(
+    "INSERT INTO user_stats (user_id, {columns}) "
+    "VALUES (:user_id, {values}) "
+    "ON CONFLICT (user_id) DO UPDATE SET {updates}".format(
+        columns=", ".join(_STATS_COLUMNS),
+        values=", ".join(":" + name for name in _STATS_COLUMNS),
+        updates=", ".join("{0} = user_stats.{0} + EXCLUDED.{0}".format(name)
+                          for name in _STATS_COLUMNS)
+    )
+)
+
+
+def _increment(session, user_id, **deltas):
+    """Add deltas to user stats columns, create stats row if it is missing.
+
+        Single upsert statement, so concurrent first increments of the same
+        user don't conflict.
+
+    """
+
+    params = {name: deltas.get(name, 0) for name in _STATS_COLUMNS}
+    session.execute(_upsert, dict(params, user_id=user_id))
+
+
+def record_question(session, user_id):
+    """Count new question of user"""
+
+    _increment(session, user_id, questions_count=1)
+
+
+def record_answer(session, user_id):
+    """Count new answer of user"""
+
+    _increment(session, user_id, answers_count=1)
+
+
+def record_vote(session, voter_id, author_id, rating):
+    """Count vote of voter for answer of author
+
+        :param session:
+            db session;
+        :param voter_id:
+            id of user who voted;
+        :param author_id:
+            id of answer author;
+        :param rating:
+            vote value, 1 or -1.
+
+    """
+
+    _increment(session, voter_id, votes_cast=1)
+    _increment(session, author_id, reputation=rating)
+
+
+def _answers_stats(model, name):
+    return select([
+        model.user_id.label("user_id"),
+        func.count(model.id).label("count"),
+        func.sum(model.score).label("score"),
+    ]).group_by(model.user_id).alias(name)
+
+
+def _questions_stats(model, name):
+    return select([
+        model.user_id.label("user_id"),
+        func.count(model.id).label("count"),
+    ]).group_by(model.user_id).alias(name)
+
+
+def rebuild_user_stats(session):
+    """Recreate stats of all users with one INSERT ... SELECT.
+
+        Archived questions, answers and votes are counted too.
+
+    """
+
+    answers = _answers_stats(Answer, "answers")
+    archived_answers = _answers_stats(ArchivedAnswer, "archived_answers")
+    questions = _questions_stats(Question, "questions")
+    archived_questions = _questions_stats(ArchivedQuestion,
+                                          "archived_questions")
+
+    all_votes = union_all(
+        select([AnswerRating.user_id.label("user_id")]),
+        select([ArchivedAnswerRating.user_id.label("user_id")])
+    ).alias("all_votes")
+    votes = select([
+        all_votes.c.user_id,
+        func.count(literal_column("*")).label("count"),
+    ]).group_by(all_votes.c.user_id).alias("votes")
+
+    stats = select([
+        User.id,
+        func.coalesce(answers.c.score, 0) +
+        func.coalesce(archived_answers.c.score, 0),
+        func.coalesce(answers.c.count, 0) +
+        func.coalesce(archived_answers.c.count, 0),
+        func.coalesce(questions.c.count, 0) +
+        func.coalesce(archived_questions.c.count, 0),
+        func.coalesce(votes.c.count, 0),
+    ]).select_from(
+        User.__table__.
+        outerjoin(answers, answers.c.user_id == User.id).
+        outerjoin(archived_answers, archived_answers.c.user_id == User.id).
+        outerjoin(questions, questions.c.user_id == User.id).
+        outerjoin(archived_questions,
+                  archived_questions.c.user_id == User.id).
+        outerjoin(votes, votes.c.user_id == User.id)
+    )
+
+    table = UserStats.__table__
+    session.execute(table.delete())
+    session.execute(table.insert().from_select(
+        ["user_id", "reputation", "answers_count", "questions_count",
+         "votes_cast"],
+        stats
+    ))
+    session.commit()
+
+
+if __name__ == "__main__":
+    from db_engine.db_session import DBSession
+    from __config import *
+
+    session = DBSession(DB_USER_NAME, DB_PASSWORD, DB_HOST,
+                        DB_BASE_NAME, LOGGER_NAME)
+    rebuild_user_stats(session)
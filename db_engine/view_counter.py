@@ -0,0 +1,173 @@
+"""Question view counters.
+
+    Views are counted in process memory and flushed to db periodically in
+    one batched update, so reading question costs a dict increment and
+    doesn't write to db. Unique viewers are counted approximately with
+    HyperLogLog sketch which is stored in question_viewers table.
+
+"""
+
+import hashlib
+import math
+import threading
+
+from sqlalchemy import bindparam
+
+from .db_models import Question, QuestionViewers
+
+
+class HyperLogLog(object):
+    """HyperLogLog cardinality sketch, 2 ** precision bytes in size.
+
+        Standard error is about 1.04 / sqrt(2 ** precision), 3.25% for
+        default precision.
+
+    """
+
+    def __init__(self, precision=10, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is None:
+            registers = bytearray(self.size)
+        self.registers = registers
+
+    @classmethod
+    def from_bytes(cls, data):
+        registers = bytearray(data)
+        return cls(int(math.log2(len(registers))), registers)
+
+    def to_bytes(self):
+        return bytes(self.registers)
+
+    def add(self, value):
+        digest = hashlib.sha1(value.encode("utf-8")).digest()
+        hashed = int.from_bytes(digest[:8], "big")
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(max(first, second) for first, second
+                                   in zip(self.registers, other.registers))
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size ** 2 / \
+            sum(2.0 ** -register for register in self.registers)
+
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            # linear counting for small cardinalities
+            estimate = self.size * math.log(self.size / zeros)
+
+        return int(round(estimate))
+
+
+class ViewCounter(object):
+
+    def __init__(self, precision=10):
+        """Create in-process buffer of question views.
+
+            :param precision:
+                HyperLogLog precision of unique viewers sketches.
+
+        """
+
+        self.precision = precision
+        self._lock = threading.Lock()
+        self._views = {}
+        self._viewers = {}
+
+    def record(self, question_id, viewer):
+        """Count question view.
+
+            :param question_id:
+                viewed question id;
+            :param viewer:
+                string which identifies viewer.
+
+        """
+
+        question_id = int(question_id)
+        with self._lock:
+            self._views[question_id] = self._views.get(question_id, 0) + 1
+            sketch = self._viewers.get(question_id)
+            if sketch is None:
+                sketch = self._viewers[question_id] = \
+                    HyperLogLog(self.precision)
+            sketch.add(viewer)
+
+    def flush(self, session):
+        """Write buffered views to db in one transaction.
+
+            Views are returned to buffer if transaction fails.
+
+            :param session:
+                db session.
+
+        """
+
+        with self._lock:
+            views, self._views = self._views, {}
+            viewers, self._viewers = self._viewers, {}
+
+        if not views:
+            return
+
+        try:
+            table = Question.__table__
+            update = table.update().\
+                where(table.c.id == bindparam("question_id")).\
+                values(views=table.c.views + bindparam("count"))
+            session.execute(update, [
+                {"question_id": question_id, "count": count}
+                for question_id, count in views.items()
+            ])
+
+            stored = session.query(QuestionViewers).\
+                filter(QuestionViewers.question_id.in_(viewers)).\
+                with_for_update()
+            stored = {row.question_id: row for row in stored}
+            # skip questions removed since view
+            existing = session.query(Question.id).\
+                filter(Question.id.in_(viewers))
+            existing = {row.id for row in existing}
+            for question_id, sketch in viewers.items():
+                if question_id not in existing:
+                    continue
+                if question_id in stored:
+                    row = stored[question_id]
+                    merged = HyperLogLog.from_bytes(row.sketch)
+                    merged.merge(sketch)
+                    row.sketch = merged.to_bytes()
+                else:
+                    session.add(QuestionViewers(question_id,
+                                                sketch.to_bytes()))
+
+            session.commit()
+
+        except Exception:
+            session.rollback()
+            self._restore(views, viewers)
+            raise
+
+    def _restore(self, views, viewers):
+        with self._lock:
+            for question_id, count in views.items():
+                self._views[question_id] = \
+                    self._views.get(question_id, 0) + count
+            for question_id, sketch in viewers.items():
+                if question_id in self._viewers:
+                    sketch.merge(self._viewers[question_id])
+                self._viewers[question_id] = sketch
+
+
+def unique_viewers(session, question_id):
+    """Get approximate amount of question unique viewers"""
+
+    row = session.query(QuestionViewers).get(question_id)
+    if row is None:
+        return 0
+    return HyperLogLog.from_bytes(row.sketch).count()
@@ -0,0 +1,51 @@
+import threading
+from logging import getLogger
+
+
+class PeriodicWorker(threading.Thread):
+    """Background thread which calls function every interval seconds"""
+
+    def __init__(self, name, function, interval, logger_name,
+                 run_first=False):
+        """Create worker, start it with start().
+
+            :param name:
+                worker name;
+            :param function:
+                function without arguments to call;
+            :param interval:
+                seconds between two calls;
+            :param logger_name:
+                name of logger to write errors to;
+            :param run_first:
+                flag: call function right after start too.
+
+        """
+
+        super().__init__(name=name, daemon=True)
+        self.function = function
+        self.interval = interval
+        self.logger = getLogger(logger_name)
+        self.run_first = run_first
+        self._stopped = threading.Event()
+
+    def run(self):
+        if self.run_first:
+            self.run_once()
+        while not self._stopped.wait(self.interval):
+            self.run_once()
+
+    def run_once(self):
+        try:
+            self.function()
+        except Exception:
+            self.logger.exception("Worker {} failed.".format(self.name))
+
+    def stop(self, run_last=True):
+        """Stop worker, call function last time if needed"""
+
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
+        if run_last:
+            self.run_once()
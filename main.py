@@ -1,7 +1,14 @@
 from flask import Flask
-from promua_test_app.views import *
 from flask_wtf import CsrfProtect
 
+from promua_test_app.views import profiler, login_manager, limiter, \
+    broadcaster, before_request, after_request, teardown_app_context, \
+    apply_hot_ranking, flush_view_counter, refresh_duplicate_index
+from promua_test_app.views import IndexView, UserView, AdminView, ServiceView
+
+from promua_test_app.extensions.compression import CompressionMiddleware
+from db_engine.workers import PeriodicWorker
+
 import __config as config
 
 app = Flask(__name__)
@@ -10,17 +17,56 @@ app.config.from_object(config)
 # setup extensions
 csrf_protect = CsrfProtect()
 # init extensions
+profiler.init_app(app)
 csrf_protect.init_app(app)
 login_manager.init_app(app)
+limiter.init_app(app)
+broadcaster.init_app(app)
+# compress responses
+app.wsgi_app = CompressionMiddleware(
+    app.wsgi_app,
+    min_size=app.config.get("COMPRESSION_MIN_SIZE", 500),
+    level=app.config.get("COMPRESSION_LEVEL", 6)
+)
 # setup static and templates
 app.template_folder = "promua_test_app/templates"
 app.static_folder = "promua_test_app/static"
 # register handlers
 app.before_request(before_request)
+app.after_request(after_request)
 app.teardown_appcontext(teardown_app_context)
 # register views
 IndexView.register(app)
 UserView.register(app)
+AdminView.register(app)
+ServiceView.register(app)
+# setup background workers
+workers = [
+    PeriodicWorker("hot-ranking", apply_hot_ranking,
+                   app.config.get("HOT_RANK_INTERVAL", 10),
+                   config.LOGGER_NAME),
+    PeriodicWorker("view-counter", flush_view_counter,
+                   app.config.get("VIEW_COUNTER_INTERVAL", 5),
+                   config.LOGGER_NAME),
+    PeriodicWorker("duplicate-index", refresh_duplicate_index,
+                   app.config.get("DUPLICATE_INDEX_INTERVAL", 30),
+                   config.LOGGER_NAME, run_first=True),
+]
+
+
+def start_workers():
+    for worker in workers:
+        worker.start()
+
+
+def stop_workers():
+    for worker in workers:
+        worker.stop()
+
 
 if __name__ == '__main__':
-    app.run()
+    start_workers()
+    try:
+        app.run()
+    finally:
+        stop_workers()
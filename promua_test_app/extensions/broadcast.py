@@ -0,0 +1,259 @@
+"""
+    Broadcast
+    ---------
+
+    Publish/subscribe of events to server-sent events connections.
+
+    Every subscription has bounded queue. Subscriber which doesn't read
+    events fast enough is evicted when its queue is full, so slow client
+    can't make publisher wait or grow memory.
+
+    Every stream holds a request thread, so it is closed after lifetime
+    seconds and client reconnects after "retry" delay, and only
+    max_streams streams are open in one process at a time. Streams are
+    closed at once by stop() when worker is going to exit.
+
+    Config:
+        - BROADCAST_ENABLED: flag to publish events and open streams;
+        - BROADCAST_MAX_STREAMS: amount of streams open in one process,
+          must be less than amount of request threads;
+        - BROADCAST_QUEUE_SIZE: amount of events waiting for subscriber;
+        - BROADCAST_STREAM_LIFETIME: seconds to keep stream open;
+        - BROADCAST_SOCKET_DIR: directory of unix sockets to deliver events
+          between local processes, events stay in process when it is None.
+
+"""
+
+import os
+import json
+import time
+import queue
+import socket
+import threading
+from logging import getLogger
+
+
+class Subscription(object):
+
+    def __init__(self, broadcaster, channel, size):
+        self.broadcaster = broadcaster
+        self.channel = channel
+        self.queue = queue.Queue(size)
+        self.closed = False
+
+    def get(self, timeout):
+        """Get next message or None when nothing came in timeout seconds"""
+
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.closed = True
+        self.broadcaster.unsubscribe(self)
+
+
+class LocalBackend(object):
+    """Deliver events to subscribers of current process only"""
+
+    def publish(self, channel, message, deliver):
+        deliver(channel, message)
+
+
+class UnixSocketBackend(object):
+    """Deliver events to subscribers of all local processes.
+
+        Every process binds datagram socket in shared directory and sends
+        events to sockets of all other processes.
+
+    """
+
+    def __init__(self, directory, logger_name="broadcast"):
+        self.directory = directory
+        self.logger = getLogger(logger_name)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._socket = None
+        self._path = None
+
+    def _start(self, deliver):
+        """Bind socket of current process, once per process"""
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory,
+                                "{}.sock".format(os.getpid()))
+            if os.path.exists(path):
+                os.remove(path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(path)
+
+            self._socket = sock
+            self._path = path
+            self._pid = os.getpid()
+
+            thread = threading.Thread(target=self._receive,
+                                      args=(sock, deliver), daemon=True)
+            thread.start()
+
+    def _receive(self, sock, deliver):
+        while True:
+            data = sock.recv(65536)
+            try:
+                channel, message = json.loads(data.decode("utf-8"))
+            except ValueError:
+                continue
+            deliver(channel, message)
+
+    def publish(self, channel, message, deliver):
+        self._start(deliver)
+        deliver(channel, message)
+
+        data = json.dumps([channel, message]).encode("utf-8")
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path == self._path or not name.endswith(".sock"):
+                continue
+            try:
+                self._socket.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # process is dead, remove its socket
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            except OSError as error:
+                self.logger.warning("Can't send event to {}: {}".
+                                    format(path, error))
+
+    def subscribe(self, deliver):
+        self._start(deliver)
+
+
+class Broadcaster(object):
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.queue_size = 100
+        self.stream_lifetime = 60
+        self.max_streams = 4
+        self.stopping = False
+        self.backend = LocalBackend()
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+        self._streams = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("BROADCAST_ENABLED", False)
+        self.max_streams = app.config.get("BROADCAST_MAX_STREAMS", 4)
+        self.queue_size = app.config.get("BROADCAST_QUEUE_SIZE", 100)
+        self.stream_lifetime = app.config.get("BROADCAST_STREAM_LIFETIME", 60)
+        directory = app.config.get("BROADCAST_SOCKET_DIR")
+        if directory:
+            self.backend = UnixSocketBackend(directory,
+                                             app.config.get("LOGGER_NAME",
+                                                            "broadcast"))
+
+    def subscribe(self, channel):
+        if hasattr(self.backend, "subscribe"):
+            self.backend.subscribe(self.deliver)
+
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+    def publish(self, channel, event, data):
+        """Send event to all subscribers of channel.
+
+            :param channel:
+                channel name;
+            :param event:
+                event name;
+            :param data:
+                json serializable event data.
+
+        """
+
+        if not self.enabled:
+            return
+
+        message = "event: {}\ndata: {}\n\n".format(event, json.dumps(data))
+        self.backend.publish(channel, message, self.deliver)
+
+    def deliver(self, channel, message):
+        """Put message to queues of subscribers of current process"""
+
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+
+        for subscription in subscriptions:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                # slow client, stop its stream
+                subscription.close()
+
+    def stop(self):
+        """Close all streams in a second, safe to call from signal handler"""
+
+        self.stopping = True
+
+    def stream(self, channel, keep_alive=15, poll=1.0):
+        """Get iterator of server-sent events of channel or None when
+        broadcaster is disabled or max_streams streams are already open"""
+
+        with self._lock:
+            if not self.enabled or self._streams >= self.max_streams:
+                return None
+            self._streams += 1
+        return self._stream(channel, keep_alive, poll)
+
+    def _stream(self, channel, keep_alive, poll):
+        """Iterate server-sent events of channel until subscription closes,
+        lifetime passes or broadcaster stops"""
+
+        try:
+            subscription = self.subscribe(channel)
+        except Exception:
+            self._release_stream()
+            raise
+        deadline = time.monotonic() + self.stream_lifetime
+        last_sent = time.monotonic()
+        try:
+            yield "retry: 5000\n\n"
+            while not subscription.closed and not self.stopping:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                message = subscription.get(min(poll, deadline - now))
+                if subscription.closed or self.stopping:
+                    break
+                if message is not None:
+                    yield message
+                    last_sent = time.monotonic()
+                elif time.monotonic() - last_sent >= keep_alive:
+                    yield ": keep-alive\n\n"
+                    last_sent = time.monotonic()
+        finally:
+            subscription.close()
+            self._release_stream()
+
+    def _release_stream(self):
+        with self._lock:
+            self._streams -= 1
@@ -0,0 +1,237 @@
+"""
+    Response compression
+    --------------------
+
+    WSGI middleware which compresses responses with gzip or brotli (when
+    brotli package is installed).
+
+    Response is compressed when:
+        - client accepts gzip or br encoding;
+        - content type is in allow list;
+        - response isn't encoded already and doesn't forbid transforming;
+        - body is at least min_size bytes.
+
+    Strong ETag of compressed response is made weak, it describes
+    uncompressed body.
+
+    Body is compressed chunk by chunk with flush after every chunk, so
+    streamed responses are delivered without waiting for the whole body.
+    Responses which already carry Content-Encoding (for example fragments
+    cached in compressed form with compress_body) are passed as is.
+
+"""
+
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# dynamic responses only, static files would be compressed on every request
+DEFAULT_MIMETYPES = (
+    "text/html",
+    "text/plain",
+    "text/xml",
+    "application/json",
+)
+
+
+def accepted_encoding(accept_encoding):
+    """Choose best supported encoding from Accept-Encoding header value.
+
+        Return "br", "gzip" or None.
+
+    """
+
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+
+    default = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", default) > 0:
+        return "br"
+    if accepted.get("gzip", default) > 0:
+        return "gzip"
+    return None
+
+
+def compress_body(data, encoding, level=6):
+    """Compress whole body with encoding ("gzip" or "br")"""
+
+    encoder = _make_encoder(encoding, level)
+    return encoder.compress(data) + encoder.finish()
+
+
+def _make_encoder(encoding, level):
+    if encoding == "br":
+        return _BrotliEncoder(level)
+    return _GzipEncoder(level)
+
+
+class _GzipEncoder(object):
+
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                           16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self.compressor.compress(data) + \
+            self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder(object):
+
+    def __init__(self, level):
+        # brotli quality is 0..11, level is zlib like 1..9
+        self.compressor = brotli.Compressor(quality=min(11, level))
+
+    def compress(self, data):
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class CompressionMiddleware(object):
+
+    def __init__(self, app, min_size=500, mimetypes=DEFAULT_MIMETYPES,
+                 level=6):
+        """Wrap wsgi application.
+
+            :param app:
+                wsgi application;
+            :param min_size:
+                minimal body size in bytes to compress;
+            :param mimetypes:
+                content types which can be compressed;
+            :param level:
+                compression level 1..9.
+
+        """
+
+        self.app = app
+        self.min_size = min_size
+        self.mimetypes = frozenset(mimetypes)
+        self.level = level
+
+    def __call__(self, environ, start_response):
+        encoding = None
+        if environ.get("REQUEST_METHOD") != "HEAD":
+            encoding = accepted_encoding(environ.get("HTTP_ACCEPT_ENCODING", ""))
+
+        response = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            response["status"] = status
+            response["headers"] = headers
+            response["exc_info"] = exc_info
+            # body is written through returned iterable only
+            return None
+
+        app_iter = self.app(environ, capture_start_response)
+
+        return self._iterate(app_iter, response, start_response, encoding)
+
+    def compressible(self, status, headers):
+        """Check if response with such status and headers can be compressed"""
+
+        if status[:3] in ("204", "304"):
+            return False
+
+        content_type = ""
+        for name, value in headers:
+            name = name.lower()
+            if name == "content-encoding":
+                return False
+            if name == "cache-control" and "no-transform" in value.lower():
+                return False
+            if name == "content-type":
+                content_type = value.split(";")[0].strip().lower()
+
+        return content_type in self.mimetypes
+
+    def _iterate(self, app_iter, response, start_response, encoding):
+        try:
+            iterator = iter(app_iter)
+
+            # pass not compressible responses without buffering
+            if "status" in response and \
+                    not self.compressible(response["status"],
+                                          response["headers"]):
+                start_response(response["status"], response["headers"],
+                               response["exc_info"])
+                for chunk in iterator:
+                    yield chunk
+                return
+
+            # collect body until it is large enough to compress
+            buffered = []
+            size = 0
+            exhausted = True
+            for chunk in iterator:
+                if chunk:
+                    buffered.append(chunk)
+                    size += len(chunk)
+                if size >= self.min_size:
+                    exhausted = False
+                    break
+
+            status = response["status"]
+            headers = list(response["headers"])
+            compressible = self.compressible(status, headers)
+
+            if compressible:
+                self._add_vary(headers)
+
+            if not (compressible and encoding and size >= self.min_size):
+                start_response(status, headers, response["exc_info"])
+                for chunk in buffered:
+                    yield chunk
+                if not exhausted:
+                    for chunk in iterator:
+                        yield chunk
+                return
+
+            headers = [(name, self._weak_etag(value)
+                        if name.lower() == "etag" else value)
+                       for name, value in headers
+                       if name.lower() != "content-length"]
+            headers.append(("Content-Encoding", encoding))
+            start_response(status, headers, response["exc_info"])
+
+            encoder = _make_encoder(encoding, self.level)
+            yield encoder.compress(b"".join(buffered))
+            for chunk in iterator:
+                if chunk:
+                    yield encoder.compress(chunk)
+            yield encoder.finish()
+
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+
+    @staticmethod
+    def _weak_etag(value):
+        return value if value.startswith("W/") else "W/" + value
+
+    @staticmethod
+    def _add_vary(headers):
+        for ind, (name, value) in enumerate(headers):
+            if name.lower() == "vary":
+                if "accept-encoding" not in value.lower():
+                    headers[ind] = (name, value + ", Accept-Encoding")
+                return
+        headers.append(("Vary", "Accept-Encoding"))
@@ -13,7 +13,9 @@
     Add:
         - hid static methods from routing;
         - add before function to use together with before_view_name;
-        - add after function to use together with after_view_function.
+        - add after function to use together with after_view_function;
+        - add limit functions which run before any before function;
+        - use getfullargspec on python 3.
 
 """
 
@@ -29,6 +31,8 @@ import re
 
 _py2 = sys.version_info[0] == 2
 
+_getargspec = inspect.getargspec if _py2 else inspect.getfullargspec
+
 
 def route(rule, **options):
     """A decorator that is used to define custom routes for methods in
@@ -305,9 +309,17 @@ class FlaskView(object):
                 # behavior.
                 del forgettable_view_args
 
+                limit_fullname = "limit_{}".format(view.__name__)
                 before_fullname = "before_{}".format(view.__name__)
                 after_fullname = "after_{}".format(view.__name__)
 
+                # limit function, checked before any db work
+                if limit_fullname in proxy_functions:
+                    for func in proxy_functions[limit_fullname]:
+                        response = func(**request.view_args)
+                        if response:
+                            return response
+
                 # before function
                 if before_fullname in proxy_functions:
                     for func in proxy_functions[before_fullname]:
@@ -480,7 +492,7 @@ def get_true_argspec(method):
 
     """
 
-    argspec = inspect.getargspec(method)
+    argspec = _getargspec(method)
     args = argspec[0]
     if args and args[0] == 'self':
         return argspec
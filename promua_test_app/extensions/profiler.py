@@ -0,0 +1,171 @@
+"""
+    Request profiler
+    ----------------
+
+    Profile sampled part of requests with cProfile and save pstats files per
+    endpoint.
+
+    Request is profiled when:
+        - random sample hits PROFILER_SAMPLE_RATE (0..1);
+        - request carries PROFILER_HEADER with PROFILER_SECRET value.
+
+    Files are written to PROFILER_DIR/<endpoint>/ and the oldest ones are
+    removed when endpoint directory grows over PROFILER_MAX_BYTES.
+    Summary is built from PROFILER_SUMMARY_FILES newest files of endpoint.
+    Not sampled request costs one random() call.
+
+"""
+
+import os
+import re
+import time
+import random
+
+from flask import g, request
+
+
+class RequestProfiler(object):
+
+    def __init__(self, app=None):
+        self.sample_rate = 0.0
+        self.header = None
+        self.secret = None
+        self.directory = None
+        self.max_bytes = 0
+        self.summary_files = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read config and register request hooks.
+
+            Must be called before any other before_request hook is
+            registered to profile them too.
+
+        """
+
+        self.sample_rate = app.config.get("PROFILER_SAMPLE_RATE", 0.0)
+        self.header = app.config.get("PROFILER_HEADER", "X-Profile")
+        self.secret = app.config.get("PROFILER_SECRET")
+        self.directory = app.config.get("PROFILER_DIR", "profiles")
+        self.max_bytes = app.config.get("PROFILER_MAX_BYTES", 50 * 1024 * 1024)
+        self.summary_files = app.config.get("PROFILER_SUMMARY_FILES", 100)
+
+        app.before_request(self.start)
+        app.teardown_request(self.stop)
+
+    def need_profile(self):
+        """Check if current request must be profiled"""
+
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        if self.secret and request.headers.get(self.header) == self.secret:
+            return True
+        return False
+
+    def start(self):
+        if not self.need_profile():
+            return
+
+        # import only when really profiling
+        import cProfile
+
+        g.profile = cProfile.Profile()
+        g.profile.enable()
+
+    def stop(self, *args, **kwargs):
+        profile = getattr(g, "profile", None)
+        if profile is None:
+            return
+        del g.profile
+
+        profile.disable()
+
+        directory = self.endpoint_directory(request.endpoint)
+        os.makedirs(directory, exist_ok=True)
+        name = "{}-{}.pstats".format(int(time.time() * 1000000), os.getpid())
+        profile.dump_stats(os.path.join(directory, name))
+
+        self.rotate(directory)
+
+    def endpoint_directory(self, endpoint):
+        endpoint = re.sub(r"[^\w.-]", "_", endpoint or "unknown")
+        return os.path.join(self.directory, endpoint)
+
+    def rotate(self, directory):
+        """Remove the oldest files while directory is bigger than max_bytes"""
+
+        files = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            # file can be removed by another worker meanwhile
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        size = sum(file[1] for file in files)
+
+        for _, file_size, path in files:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+
+    def endpoints(self):
+        """Return names of endpoints which have saved profiles"""
+
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(os.listdir(self.directory))
+
+    def summary(self, limit=20):
+        """Get hottest functions of every profiled endpoint.
+
+            Return list of (endpoint, samples, functions) where functions is
+            list of (function, calls, total time, cumulative time) sorted by
+            total time.
+
+            :param limit:
+                amount of functions for every endpoint.
+
+        """
+
+        import pstats
+
+        result = []
+        for endpoint in self.endpoints():
+            directory = os.path.join(self.directory, endpoint)
+            # names start with time, so the newest files go first
+            names = sorted(os.listdir(directory), reverse=True)
+
+            stats, samples = None, 0
+            for name in names[:self.summary_files]:
+                path = os.path.join(directory, name)
+                # file can be removed by rotation of another worker or
+                # still be written
+                try:
+                    if stats is None:
+                        stats = pstats.Stats(path)
+                    else:
+                        stats.add(path)
+                except (FileNotFoundError, EOFError):
+                    continue
+                samples += 1
+            if stats is None:
+                continue
+
+            functions = []
+            for func, (_, calls, tottime, cumtime, _) in stats.stats.items():
+                functions.append((pstats.func_std_string(func), calls,
+                                  tottime, cumtime))
+            functions.sort(key=lambda func: func[2], reverse=True)
+
+            result.append((endpoint, samples, functions[:limit]))
+
+        return result
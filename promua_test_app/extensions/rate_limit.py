@@ -0,0 +1,296 @@
+"""
+    Rate limit
+    ----------
+
+    Token bucket admission control for FlaskView methods.
+
+    Limits are checked by FlaskView proxy before any before function or
+    view is called, so rejected requests don't touch db or hash passwords.
+    Rejected request gets 429 response with Retry-After header.
+
+    Example:
+
+        limiter = RateLimiter()
+
+        class MyView(FlaskView):
+
+            @limiter.limit("5/minute", per="ip", methods=["POST"])
+            def post(self):
+                ...
+
+    Config:
+        - RATE_LIMIT_ENABLED: flag to check limits;
+        - RATE_LIMIT_STORAGE: path of sqlite file shared by local processes,
+          buckets and rejection counts are kept in process memory when it
+          is None;
+        - RATE_LIMITS: dict of endpoint to limit string which overrides
+          limits given in decorators.
+
+"""
+
+import os
+import math
+import time
+import threading
+from collections import Counter
+
+from flask import request, session, Response
+
+
+PERIODS = {
+    "second": 1,
+    "minute": 60,
+    "hour": 60 * 60,
+    "day": 24 * 60 * 60,
+}
+
+
+def parse_limit(limit):
+    """Parse "<count>/<period>" limit string.
+
+        Return (rate in tokens per second, bucket size).
+
+    """
+
+    count, _, period = limit.partition("/")
+    count = int(count)
+    return count / PERIODS[period.strip()], count
+
+
+class MemoryBackend(object):
+    """Buckets in process memory"""
+
+    # counts of one process only
+    shared = False
+
+    def __init__(self, cleanup_every=10000):
+        self.cleanup_every = cleanup_every
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._rejections = Counter()
+        self._calls = 0
+
+    def consume(self, key, rate, size):
+        """Take token from bucket.
+
+            Return 0 if token is taken or seconds to wait for the next one.
+
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            self._calls += 1
+            if self._calls % self.cleanup_every == 0:
+                self._cleanup(now)
+
+            tokens, updated, _ = self._buckets.get(key, (size, now, now))
+            tokens = min(size, tokens + (now - updated) * rate)
+
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+
+            full_at = now + (size - tokens) / rate
+            self._buckets[key] = (tokens, now, full_at)
+
+            return wait
+
+    def reject(self, endpoint):
+        """Count rejected request of endpoint"""
+
+        with self._lock:
+            self._rejections[endpoint] += 1
+
+    def rejections(self):
+        """Counter of rejected requests by endpoint"""
+
+        with self._lock:
+            return Counter(self._rejections)
+
+    def _cleanup(self, now):
+        """Drop full buckets, they are the same as missing ones"""
+
+        self._buckets = {key: bucket for key, bucket in self._buckets.items()
+                         if bucket[2] > now}
+
+
+class SQLiteBackend(object):
+    """Buckets and rejection counts in sqlite file shared by all local
+    processes"""
+
+    shared = True
+
+    def __init__(self, path, cleanup_every=10000):
+        self.path = path
+        self.cleanup_every = cleanup_every
+        self._local = threading.local()
+        self._calls = 0
+
+    def _connection(self):
+        # connections mustn't be shared between forked processes
+        if getattr(self._local, "pid", None) != os.getpid():
+            import sqlite3
+            connection = sqlite3.connect(self.path, timeout=5,
+                                         isolation_level=None)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS bucket ("
+                "key TEXT PRIMARY KEY, tokens REAL, updated REAL, "
+                "full_at REAL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS rejection ("
+                "endpoint TEXT PRIMARY KEY, count INTEGER NOT NULL)"
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def consume(self, key, rate, size):
+        """Take token from bucket.
+
+            Return 0 if token is taken or seconds to wait for the next one.
+
+        """
+
+        connection = self._connection()
+        now = time.time()
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._calls += 1
+            if self._calls % self.cleanup_every == 0:
+                connection.execute("DELETE FROM bucket WHERE full_at <= ?",
+                                   (now,))
+
+            row = connection.execute(
+                "SELECT tokens, updated FROM bucket WHERE key = ?", (key,)
+            ).fetchone()
+            tokens, updated = row if row else (size, now)
+            tokens = min(size, tokens + max(0, now - updated) * rate)
+
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+
+            connection.execute(
+                "INSERT OR REPLACE INTO bucket VALUES (?, ?, ?, ?)",
+                (key, tokens, now, now + (size - tokens) / rate)
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        return wait
+
+    def reject(self, endpoint):
+        """Count rejected request of endpoint"""
+
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT OR IGNORE INTO rejection VALUES (?, 0)", (endpoint,)
+            )
+            connection.execute(
+                "UPDATE rejection SET count = count + 1 WHERE endpoint = ?",
+                (endpoint,)
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def rejections(self):
+        """Counter of rejected requests by endpoint"""
+
+        rows = self._connection().execute(
+            "SELECT endpoint, count FROM rejection"
+        )
+        return Counter(dict(rows.fetchall()))
+
+
+class RateLimiter(object):
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.backend = MemoryBackend()
+        self.overrides = {}
+
+        if app is not None:
+            self.init_app(app)
+
+    @property
+    def rejections(self):
+        """Counter of rejected requests by endpoint, shared by processes
+        when buckets are"""
+
+        return self.backend.rejections()
+
+    def init_app(self, app):
+        self.enabled = app.config.get("RATE_LIMIT_ENABLED", True)
+        self.overrides = app.config.get("RATE_LIMITS", {})
+        storage = app.config.get("RATE_LIMIT_STORAGE")
+        if storage:
+            self.backend = SQLiteBackend(storage)
+
+    def limit(self, limit, per="ip", methods=None):
+        """Wrapper uses to limit view calls.
+
+            :param limit:
+                "<count>/<second|minute|hour|day>" string;
+            :param per:
+                "ip" to limit every client address or "user" to limit every
+                logged in user (anonymous users are limited by address);
+            :param methods:
+                list of limited http methods, all methods when None.
+
+        """
+
+        def check(**view_args):
+            return self.check(limit, per, methods)
+
+        def add_function(f):
+
+            if not hasattr(f, '_rule_cache') or f._rule_cache is None:
+                f._rule_cache = {"limit_" + f.__name__: [check]}
+            elif not "limit_" + f.__name__ in f._rule_cache:
+                f._rule_cache["limit_" + f.__name__] = [check]
+            else:
+                f._rule_cache["limit_" + f.__name__].append(check)
+
+            return f
+
+        return add_function
+
+    def check(self, limit, per, methods):
+        """Take token for current request or return 429 response"""
+
+        if not self.enabled:
+            return None
+        if methods and request.method not in methods:
+            return None
+
+        endpoint = request.endpoint
+        rate, size = parse_limit(self.overrides.get(endpoint, limit))
+
+        # flask-login keeps id in session, so user isn't loaded from db
+        identity = None
+        if per == "user":
+            identity = session.get("user_id")
+        if identity is None:
+            identity = request.remote_addr
+        key = "{}:{}:{}".format(endpoint, per, identity)
+
+        wait = self.backend.consume(key, rate, size)
+        if not wait:
+            return None
+
+        self.backend.reject(endpoint)
+
+        return Response("Too many requests, try again later.", status=429,
+                        headers={"Retry-After": str(int(math.ceil(wait)))})
@@ -1,6 +1,6 @@
 from functools import partial
 
-from wtforms import StringField, TextAreaField, PasswordField
+from wtforms import StringField, TextAreaField, PasswordField, BooleanField
 from wtforms.validators import DataRequired, EqualTo
 from flask_wtf import Form
 
@@ -31,6 +31,8 @@ class QuestionForm(Form):
 
     title = StringField("Title", validators=[missing_error("Title")()])
     content = TextAreaField("Content", validators=[missing_error("Content")()])
+    tags = StringField("Tags")
+    not_duplicate = BooleanField("My question is not a duplicate")
 
 
 class AnswerForm(Form):
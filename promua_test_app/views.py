@@ -1,51 +1,177 @@
+import os
+from threading import Lock
+
 from flask import g, render_template, request, redirect, url_for
+from flask import has_request_context, current_app, abort, Response
 
 from flask_login import LoginManager, login_user, logout_user, current_user
 from flask_login import login_required
 
-from sqlalchemy.orm import joinedload, contains_eager
 from sqlalchemy.exc import IntegrityError
 
 from .extensions.flask_new_classy import FlaskView, before, route
+from .extensions.profiler import RequestProfiler
+from .extensions.rate_limit import RateLimiter
+from .extensions.broadcast import Broadcaster
 
 from db_engine.db_session import DBSession
+from db_engine.slow_query import SlowQueryLog
+from db_engine.pool_metrics import PoolMetrics, check_health
+from db_engine import ranking
+from db_engine import queries
+from db_engine.view_counter import ViewCounter, unique_viewers
+from db_engine import user_stats
+from db_engine import tags
+from db_engine.duplicates import MinHashIndex
+from db_engine.archive import archived_question
 from db_engine.db_models import *
 
 from .forms import RegistrationForm, LoginForm, QuestionForm, AnswerForm
 
 from __config import *
+import __config as config
 
 login_manager = LoginManager()
+profiler = RequestProfiler()
+limiter = RateLimiter()
+broadcaster = Broadcaster()
+view_counter = ViewCounter()
+duplicate_index = MinHashIndex()
+
+db_session = None
+db_session_lock = Lock()
+pool_metrics = PoolMetrics()
+
+
+def current_endpoint():
+    """Return endpoint of current request or None outside of request"""
+
+    return request.endpoint if has_request_context() else None
+
+
+def setting(name, default):
+    """Get optional setting of __config.py, it works outside of application
+    context too.
+
+        :param name:
+            setting name;
+        :param default:
+            value used when existing config doesn't define setting yet.
+
+    """
+
+    return getattr(config, name, default)
+
+
+def get_db_session():
+    """Get database session shared by all requests, create it on first use"""
+
+    global db_session
+
+    with db_session_lock:
+        if db_session is None:
+            slow_query_log = SlowQueryLog(
+                LOGGER_NAME,
+                threshold=setting("SLOW_QUERY_THRESHOLD", 0.5),
+                explain_rate=setting("SLOW_QUERY_EXPLAIN_RATE", 0.0),
+                explain_interval=setting("SLOW_QUERY_EXPLAIN_INTERVAL", 60),
+                max_per_second=setting("SLOW_QUERY_MAX_PER_SECOND", 5),
+                endpoint_getter=current_endpoint
+            )
+            db_session = DBSession(
+                DB_USER_NAME, DB_PASSWORD, DB_HOST, DB_BASE_NAME, LOGGER_NAME,
+                slow_query_log=slow_query_log,
+                pool_metrics=pool_metrics,
+                pool_size=setting("DB_POOL_SIZE", 5),
+                max_overflow=setting("DB_MAX_OVERFLOW", 10),
+                statement_timeout=setting("DB_STATEMENT_TIMEOUT", None)
+            )
+
+    return db_session
 
 
 def before_request():
     """Setup database session and current user"""
 
-    g.db_session = DBSession(DB_USER_NAME, DB_PASSWORD, DB_HOST,
-                             DB_BASE_NAME, LOGGER_NAME)
+    g.db_session = get_db_session()
+    pool_metrics.start_request()
 
     g.current_user = current_user
 
 
+def after_request(response):
+    """Report time spent waiting for db connections"""
+
+    wait = pool_metrics.finish_request()
+    response.headers["Server-Timing"] = "db-wait;dur={:.2f}".format(wait * 1000)
+
+    return response
+
+
 def teardown_app_context(*args, **kwargs):
     """Clear db session"""
 
     g.db_session.remove()
 
 
+def apply_hot_ranking():
+    """Merge new answers and votes to hot questions ranking"""
+
+    session = get_db_session()
+    try:
+        ranking.apply_activity(session)
+    finally:
+        session.remove()
+
+
+def flush_view_counter():
+    """Write buffered question views to db"""
+
+    session = get_db_session()
+    try:
+        view_counter.flush(session)
+    finally:
+        session.remove()
+
+
+def refresh_duplicate_index():
+    """Load signatures of new questions to duplicates index"""
+
+    session = get_db_session()
+    try:
+        duplicate_index.refresh(session)
+    finally:
+        session.remove()
+
+
+def live_updates_enabled():
+    """Check if live updates are enabled and server can hold event stream
+    without blocking other requests"""
+
+    return broadcaster.enabled and \
+        request.environ.get("wsgi.multithread", False)
+
+
+def current_viewer():
+    """String which identifies current viewer for unique viewers counting"""
+
+    if g.current_user.is_authenticated:
+        return "user:{}".format(g.current_user.id)
+    return "anonymous:{}:{}".format(request.remote_addr,
+                                    request.headers.get("User-Agent", ""))
+
+
 class UserView(FlaskView):
 
     @staticmethod
     @login_manager.user_loader
     def load_user(user_id):
-        query = g.db_session.query(User).\
-            outerjoin(User.ratings).\
-            options(joinedload(User.ratings)).\
-            filter(User.id == user_id)
+        query = queries.user_by_id(g.db_session, user_id)
         msg = "Cant find user with id {}"
 
         return g.db_session.get_one_or_log(query, msg)
 
+    @limiter.limit("5/hour", per="ip", methods=["POST"])
     @route("/register/", methods=["GET", "POST"])
     def registration(self):
         """Register new user"""
@@ -55,6 +181,7 @@ class UserView(FlaskView):
                 request.form["username"],
                 request.form["password"]
             )
+            user.stats = UserStats()
             try:
                 g.db_session.add(user)
                 g.db_session.commit()
@@ -69,6 +196,7 @@ class UserView(FlaskView):
 
         return render_template("register.html", form=form)
 
+    @limiter.limit("10/minute", per="ip", methods=["POST"])
     @route("/login/", methods=["GET", "POST"])
     def login(self):
         form = LoginForm(request.form)
@@ -77,8 +205,7 @@ class UserView(FlaskView):
             username = request.form["username"]
             password = request.form["password"]
 
-            query = g.db_session.query(User).\
-                filter(User.username == username)
+            query = queries.user_by_username(g.db_session, username)
 
             msg = "Cant find user with username - {}"
 
@@ -105,32 +232,98 @@ class IndexView(FlaskView):
     @staticmethod
     def get_latest_questions():
         """Get questions for main page"""
-        g.questions = g.db_session.query(Question).\
-            order_by(desc(Question.date)).all()
+        g.questions = queries.latest_questions(g.db_session).all()
+
+    @staticmethod
+    def get_hot_questions():
+        """Get questions for hot page"""
+        g.questions = ranking.get_hot_questions(g.db_session,
+                                                setting("HOT_FEED_SIZE", 50))
+
+    @staticmethod
+    def get_tagged_questions(name):
+        """Get page of tag feed.
+
+            Page starts after question from "before" request argument,
+            which is a cursor of the last question of previous page.
+
+            :param name:
+                Tag name
+
+        """
+        g.tag = tags.get_tag(g.db_session, name)
+        g.questions, g.next_questions = [], None
+        if g.tag is not None:
+            g.questions, g.next_questions = tags.tagged_questions(
+                g.db_session, g.tag, request.args.get("before"),
+                setting("TAG_FEED_PAGE_SIZE", 30)
+            )
 
     @staticmethod
     def get_single_question(id_):
-        """Get single question
+        """Get single question, look for it in archive if it is missing
+
+            :param id_:
+                Question id
+
+        """
+        query = queries.question_by_id(g.db_session, id_)
+
+        g.question = g.db_session.get_one_or_log(query, None, need_log=False)
+        g.archived = False
+
+        if g.question is None:
+            g.question = archived_question(g.db_session, id_)
+            g.archived = g.question is not None
+
+        if g.question is None:
+            msg = "Such question with id {} doesn't exist."
+            g.db_session.logger.error(msg.format(id_))
+
+    @staticmethod
+    def get_unique_viewers(id_):
+        """Get approximate amount of question unique viewers
+
+            :param id_:
+                Question id
+
+        """
+        g.unique_viewers = unique_viewers(g.db_session, id_)
+
+    @staticmethod
+    def get_answers_page(id_):
+        """Get page of question answers ordered by score.
+
+            Page starts after answer from "after" request argument, which
+            is a "score:id" cursor of the last answer of previous page.
 
             :param id_:
                 Question id
 
         """
-        query = g.db_session.query(Question).\
-            outerjoin(Question.answers).\
-            options(contains_eager(Question.answers)).\
-            filter(Question.id == id_).\
-            order_by(desc(Answer.rating))
+        model = ArchivedAnswer if getattr(g, "archived", False) else Answer
+
+        try:
+            score, answer_id = map(int, request.args["after"].split(":"))
+        except (KeyError, ValueError):
+            after = None
+        else:
+            after = score, answer_id
 
-        msg = "can't find question with id {}"
+        page_size = setting("ANSWERS_PAGE_SIZE", 20)
+        answers = queries.answers_page(g.db_session, model, id_,
+                                       page_size + 1, after).all()
 
-        g.question = g.db_session.get_one_or_log(query, msg.format(id_))
+        g.answers = answers[:page_size]
+        g.next_answers = None
+        if len(answers) > page_size:
+            last = g.answers[-1]
+            g.next_answers = "{}:{}".format(last.score, last.id)
 
     @staticmethod
     def get_answer(id_):
         """Get answer to rate for"""
-        query = g.db_session.query(Answer).\
-            filter(Answer.id == id_)
+        query = queries.answer_by_id(g.db_session, id_)
 
         msg = "Can't find answer with id {}"
 
@@ -141,7 +334,27 @@ class IndexView(FlaskView):
         """Index page"""
         return render_template("index.html")
 
-    @before(get_single_question)
+    @before(get_hot_questions)
+    @route("/hot/")
+    def hot(self):
+        """Questions with the most recent activity"""
+        return render_template("index.html")
+
+    @before(get_tagged_questions)
+    @route("/tag/<name>/")
+    def tag(self, name):
+        """Questions with tag, the newest first
+
+            :param name:
+                Tag name
+
+        """
+        if g.tag is None:
+            abort(404)
+        return render_template("index.html")
+
+    @limiter.limit("30/hour", per="user", methods=["POST"])
+    @before(get_single_question, get_unique_viewers, get_answers_page)
     @route("/question/<id_>", methods=["GET", "POST"])
     def show_question(self, id_):
         """Show single question page
@@ -150,7 +363,8 @@ class IndexView(FlaskView):
                 Question id
 
         """
-        if g.current_user.is_authenticated:
+        # archived questions are read only
+        if g.current_user.is_authenticated and not g.archived:
             g.answer_form = AnswerForm()
             if request.method == "POST" and g.answer_form.validate():
                 answer = Answer(
@@ -159,10 +373,52 @@ class IndexView(FlaskView):
                 answer.author = current_user
                 answer.question_id = id_
                 g.db_session.add(answer)
+                ranking.log_activity(g.db_session, id_,
+                                     ranking.ANSWER_WEIGHT)
+                user_stats.record_answer(g.db_session, current_user.id)
                 g.db_session.commit()
+                broadcaster.publish("question:{}".format(id_), "answer", {
+                    "id": answer.id,
+                    "content": answer.content,
+                    "author": current_user.username,
+                    "score": 0,
+                })
                 return redirect(url_for("IndexView:show_question", id_=id_))
+        if g.question and not g.archived and request.method == "GET":
+            view_counter.record(g.question.id, current_viewer())
+        g.live_updates = not g.archived and live_updates_enabled()
         return render_template("question.html")
 
+    @before(get_single_question, get_answers_page)
+    @route("/question/<id_>/answers")
+    def answers(self, id_):
+        """Next page of question answers to load on question page
+
+            :param id_:
+                Question id
+
+        """
+        return render_template("answers_page.html")
+
+    @route("/question/<id_>/events")
+    def events(self, id_):
+        """Server-sent events of new answers and score changes
+
+            :param id_:
+                Question id
+
+        """
+        # 204 tells browser to stop reconnecting, page works without
+        # live updates when all streams of worker are taken
+        stream = None
+        if live_updates_enabled():
+            stream = broadcaster.stream("question:{}".format(id_))
+        if stream is None:
+            return Response(status=204)
+        return Response(stream, mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache"})
+
+    @limiter.limit("10/hour", per="user", methods=["POST"])
     @login_required
     @route("/question/new", methods=["GET", "POST"])
     def create_question(self):
@@ -170,6 +426,22 @@ class IndexView(FlaskView):
         form = QuestionForm(request.form)
         if request.method == "POST" and form.validate():
 
+            # index is loaded by worker, requests read only new signatures
+            if not form.not_duplicate.data and duplicate_index.loaded:
+                duplicate_index.refresh(g.db_session)
+                duplicates = duplicate_index.query(request.form["title"],
+                                                   request.form["content"])
+                if duplicates:
+                    ids = [question_id for question_id, _ in duplicates]
+                    questions = g.db_session.query(Question).\
+                        filter(Question.id.in_(ids))
+                    questions = {question.id: question
+                                 for question in questions}
+                    g.duplicates = [questions[question_id]
+                                    for question_id in ids
+                                    if question_id in questions]
+                    return render_template("question_new.html", form=form)
+
             question = Question(
                 request.form["title"],
                 request.form["content"],
@@ -177,12 +449,21 @@ class IndexView(FlaskView):
             question.author = current_user
 
             g.db_session.add(question)
+            g.db_session.flush()
+            duplicate_index.store(g.db_session, question.id,
+                                  question.title, question.content)
+            tags.add_tags(g.db_session, question,
+                          tags.parse_tags(form.tags.data or ""))
+            ranking.log_activity(g.db_session, question.id,
+                                 ranking.QUESTION_WEIGHT)
+            user_stats.record_question(g.db_session, current_user.id)
             g.db_session.commit()
 
             return redirect("/")
 
         return render_template("question_new.html", form=form)
 
+    @limiter.limit("60/hour", per="user")
     @before(get_answer)
     @login_required
     @route("/answer/rate/<id_>")
@@ -202,7 +483,83 @@ class IndexView(FlaskView):
             rate.user = current_user
             rate.answer_id = id_
             g.answer.ratings.append(rate)
+            g.answer.score = Answer.score + rating
             g.db_session.add(g.answer)
+            ranking.log_activity(g.db_session, g.answer.question_id,
+                                 ranking.VOTE_WEIGHT)
+            user_stats.record_vote(g.db_session, current_user.id,
+                                   g.answer.user_id, rating)
             g.db_session.commit()
+            broadcaster.publish(
+                "question:{}".format(g.answer.question_id), "score",
+                {"id": g.answer.id, "delta": rating}
+            )
+
+            return redirect(url_for("IndexView:show_question", id_=g.answer.question_id))
+
+
+class AdminView(FlaskView):
+
+    @staticmethod
+    def check_admin():
+        """Allow only users listed in ADMIN_USERNAMES"""
+        admins = current_app.config.get("ADMIN_USERNAMES", ())
+        if not g.current_user.is_authenticated or \
+                g.current_user.username not in admins:
+            abort(403)
+
+    @before(check_admin)
+    @route("/profiles/")
+    def profiles(self):
+        """Hottest functions of profiled requests per endpoint"""
+        return render_template("admin_profiles.html",
+                               summary=profiler.summary())
+
+    @before(check_admin)
+    @route("/limits/")
+    def limits(self):
+        """Amount of requests rejected by rate limits per endpoint"""
+        return render_template("admin_limits.html",
+                               rejections=limiter.rejections.most_common())
+
+
+class ServiceView(FlaskView):
 
-            return redirect(url_for("IndexView:show_question", id_=g.answer.question_id))
\ No newline at end of file
+    route_base = "/"
+
+    @staticmethod
+    def check_local():
+        """Allow only addresses listed in METRICS_ALLOWED_IPS"""
+        allowed = current_app.config.get("METRICS_ALLOWED_IPS",
+                                         ("127.0.0.1", "::1"))
+        if request.remote_addr not in allowed:
+            abort(403)
+
+    @route("/healthz")
+    def healthz(self):
+        """Check db with pooled connection"""
+        healthy, message = check_health(g.db_session.engine)
+        return Response(message, status=200 if healthy else 503,
+                        mimetype="text/plain")
+
+    @before(check_local)
+    @route("/metrics")
+    def metrics(self):
+        """Pool and rate limit metrics in Prometheus text format.
+
+            Pool metrics and not shared rejection counts belong to worker
+            which got request, they are labeled with its pid.
+
+        """
+        lines = pool_metrics.render(g.db_session.engine.pool)
+        lines += ["# HELP rate_limit_rejections_total Requests rejected "
+                  "by rate limits.",
+                  "# TYPE rate_limit_rejections_total counter"]
+        labels = 'endpoint="{}"'
+        if not limiter.backend.shared:
+            labels += ',pid="{}"'.format(os.getpid())
+        for endpoint, count in sorted(limiter.rejections.items()):
+            lines.append("rate_limit_rejections_total{{{}}} {}".format(
+                labels.format(endpoint), count))
+        return Response("\n".join(lines) + "\n",
+                        mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,378 @@
+"""Production server.
+
+    Application is imported once by master process which then forks worker
+    processes serving requests from shared listening socket.
+
+    Usage:
+
+        python serve.py --bind 0.0.0.0:8000 --workers 4 --threads 8
+
+    Signals of master process:
+        - SIGTERM, SIGINT: stop workers after current requests and exit;
+        - SIGHUP: replace workers one by one with fresh ones, old workers
+          finish current requests first. Application is preloaded, so code
+          changes still need master restart;
+        - SIGUSR1: write request counts of every worker to log.
+
+    Worker is replaced after --max-requests requests or when it dies.
+    Client which doesn't send request or read response for --timeout
+    seconds is disconnected.
+    Retiring worker is killed when it doesn't finish its requests in
+    --graceful-timeout seconds.
+    Master creates db engine before forking, so workers don't load db
+    driver on their first request, but it never connects. Every worker
+    gets its own connection pool.
+
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import signal
+import socket
+import logging
+import argparse
+import threading
+import multiprocessing
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+import main
+import promua_test_app.views as views
+
+
+logger = logging.getLogger("serve")
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def handle(self):
+        # client which doesn't send or read in time is treated as gone
+        try:
+            super().handle()
+        except socket.timeout:
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WorkerServer(WSGIServer):
+    """WSGI server on already bound listening socket"""
+
+    def __init__(self, listener, app, request_timeout=None):
+        super().__init__(listener.getsockname()[:2], QuietHandler,
+                         bind_and_activate=False)
+        self.socket.close()
+        self.socket = listener
+        host, port = listener.getsockname()[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+        self.setup_environ()
+        self.set_app(app)
+        self.request_timeout = request_timeout
+        self.handled = 0
+
+    def handle_request(self):
+        """Handle one request if it comes in timeout seconds.
+
+            Listener is non blocking to let idle workers check signals and
+            skip requests accepted by other workers.
+
+        """
+        ready, _, _ = select.select([self.socket], [], [], self.timeout)
+        if ready:
+            self._handle_request_noblock()
+
+    def get_request(self):
+        request, address = self.socket.accept()
+        # idle connection mustn't hold worker or request thread forever
+        request.settimeout(self.request_timeout)
+        return request, address
+
+    def process_request(self, request, client_address):
+        self.handled += 1
+        super().process_request(request, client_address)
+
+    def has_capacity(self):
+        return True
+
+    def wait_requests(self, timeout):
+        pass
+
+
+class ThreadPoolServer(WorkerServer):
+    """Worker server which handles requests in fixed amount of threads"""
+
+    def __init__(self, listener, app, threads, request_timeout=None):
+        super().__init__(listener, self._threaded(app), request_timeout)
+        self._free = threading.Semaphore(threads)
+        self._active = []
+
+    @staticmethod
+    def _threaded(app):
+        # wsgiref always reports single threaded server
+        def threaded_app(environ, start_response):
+            environ["wsgi.multithread"] = True
+            return app(environ, start_response)
+        return threaded_app
+
+    def has_capacity(self):
+        # don't accept requests which can't be handled right now
+        if not self._free.acquire(timeout=1.0):
+            return False
+        self._free.release()
+        return True
+
+    def process_request(self, request, client_address):
+        self.handled += 1
+        self._free.acquire()
+        thread = threading.Thread(target=self._process,
+                                  args=(request, client_address))
+        self._active = [item for item in self._active if item.is_alive()]
+        self._active.append(thread)
+        thread.start()
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._free.release()
+
+    def wait_requests(self, timeout):
+        """Wait active requests at most timeout seconds"""
+
+        deadline = time.time() + timeout
+        for thread in self._active:
+            thread.join(max(0, deadline - time.time()))
+
+
+def run_worker(cell, listener, options, counts):
+    """Serve requests in forked worker process, never returns"""
+
+    stopping = threading.Event()
+
+    def stop(*args):
+        stopping.set()
+        views.broadcaster.stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+
+    # pooled connections mustn't be shared with master and other workers
+    if views.db_session is not None:
+        views.db_session.engine.dispose()
+
+    if options.threads > 1:
+        server = ThreadPoolServer(listener, main.app, options.threads,
+                                  options.timeout)
+    else:
+        server = WorkerServer(listener, main.app, options.timeout)
+    server.timeout = 1.0
+
+    main.start_workers()
+
+    status = 0
+    try:
+        while not stopping.is_set():
+            if options.max_requests and \
+                    server.handled >= options.max_requests:
+                views.broadcaster.stop()
+                break
+            if server.has_capacity():
+                server.handle_request()
+                counts[cell] = server.handled
+        server.wait_requests(options.graceful_timeout)
+        main.stop_workers()
+    except Exception:
+        logger.exception("Worker {} failed.".format(os.getpid()))
+        status = 1
+    finally:
+        os._exit(status)
+
+
+class Master(object):
+
+    def __init__(self, options):
+        self.options = options
+        self.running = True
+        self.need_reload = False
+        self.need_report = False
+        self.listener = self.listen(options.bind, options.backlog)
+        # request counters, retiring and new workers live together on reload
+        self.counts = multiprocessing.Array("l", options.workers * 2,
+                                            lock=False)
+        self.free_cells = list(range(options.workers * 2))
+        # slot -> pid of current worker
+        self.current = {}
+        # pid -> (slot, counter cell) of current and retiring workers
+        self.living = {}
+        # pid -> time to kill retiring worker
+        self.retiring = {}
+
+    @staticmethod
+    def listen(bind, backlog):
+        host, _, port = bind.rpartition(":")
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((host or "0.0.0.0", int(port)))
+        listener.listen(backlog)
+        listener.setblocking(False)
+        return listener
+
+    def spawn(self, slot):
+        if not self.free_cells:
+            logger.warning("Can't start worker in slot {}, too many workers "
+                           "are retiring.".format(slot))
+            return None
+        cell = self.free_cells.pop()
+        self.counts[cell] = 0
+        pid = os.fork()
+        if pid == 0:
+            run_worker(cell, self.listener, self.options, self.counts)
+        self.current[slot] = pid
+        self.living[pid] = slot, cell
+        logger.info("Worker {} started in slot {}.".format(pid, slot))
+        return pid
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        # handlers only set flags, work is done by main loop
+        signal.signal(signal.SIGHUP,
+                      lambda *args: setattr(self, "need_reload", True))
+        signal.signal(signal.SIGUSR1,
+                      lambda *args: setattr(self, "need_report", True))
+
+        # engine without connections, workers inherit loaded dialect
+        views.get_db_session()
+
+        logger.info("Listening on {}.".format(self.options.bind))
+        for slot in range(self.options.workers):
+            self.spawn(slot)
+
+        while self.running:
+            self.reap()
+            self.kill_retiring()
+            if self.need_reload:
+                self.need_reload = False
+                self.reload()
+            if self.need_report:
+                self.need_report = False
+                self.report()
+            time.sleep(0.5)
+
+        self.shutdown()
+
+    def reap(self):
+        """Collect exited workers, replace current ones"""
+
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as error:
+                if error.errno == errno.ECHILD:
+                    return
+                raise
+            if not pid:
+                return
+
+            if pid not in self.living:
+                continue
+            slot, cell = self.living.pop(pid)
+            self.retiring.pop(pid, None)
+            self.free_cells.append(cell)
+            logger.info("Worker {} exited with {}, handled {} requests.".
+                        format(pid, status, self.counts[cell]))
+            if self.running and self.current.get(slot) == pid:
+                self.spawn(slot)
+
+    def reload(self):
+        for slot, pid in list(self.current.items()):
+            if pid in self.retiring:
+                continue
+            if not self.free_cells:
+                # retry when retiring workers exit or are killed
+                self.need_reload = True
+                return
+            logger.info("Replacing worker {} in slot {}.".format(pid, slot))
+            if self.spawn(slot) is not None:
+                self.retire(pid)
+
+    def retire(self, pid):
+        """Ask worker to stop, kill it after graceful timeout"""
+
+        self.retiring[pid] = time.time() + self.options.graceful_timeout
+        self.kill(pid, signal.SIGTERM)
+
+    def kill_retiring(self):
+        now = time.time()
+        for pid, deadline in list(self.retiring.items()):
+            if deadline <= now:
+                logger.warning("Retiring worker {} killed.".format(pid))
+                self.kill(pid, signal.SIGKILL)
+                del self.retiring[pid]
+
+    def stop(self, *args):
+        self.running = False
+
+    def shutdown(self):
+        for pid in list(self.living):
+            self.kill(pid, signal.SIGTERM)
+
+        deadline = time.time() + self.options.graceful_timeout
+        while self.living and time.time() < deadline:
+            self.reap()
+            time.sleep(0.1)
+
+        for pid in list(self.living):
+            logger.warning("Worker {} killed.".format(pid))
+            self.kill(pid, signal.SIGKILL)
+        self.reap()
+
+    @staticmethod
+    def kill(pid, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def report(self):
+        for pid, (slot, cell) in sorted(self.living.items()):
+            logger.info("Slot {} worker {}: {} requests.".format(
+                slot, pid, self.counts[cell]))
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description="Serve application with "
+                                                 "preforked workers.")
+    parser.add_argument("--bind", default="127.0.0.1:8000",
+                        help="host:port to listen")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="amount of worker processes")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="amount of request threads in every worker")
+    parser.add_argument("--max-requests", type=int, default=0,
+                        help="replace worker after this amount of requests, "
+                             "0 to never replace")
+    parser.add_argument("--timeout", type=float, default=5,
+                        help="seconds to wait client socket reads and "
+                             "writes, slower clients are disconnected")
+    parser.add_argument("--graceful-timeout", type=float, default=30,
+                        help="seconds to wait workers on shutdown and "
+                             "reload")
+    parser.add_argument("--backlog", type=int, default=1024,
+                        help="listening socket backlog")
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s [%(process)d] %(message)s")
+    Master(parse_args(sys.argv[1:])).run()